@@ -1,5 +1,10 @@
+import asyncio
+import functools
 import hashlib
+import json as _json
 import struct
+import aiohttp
+import numpy as np
 import requests
 import websocket
 import random
@@ -8,39 +13,83 @@ import time
 import os
 import threading
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 
+import battle
 import config
+import Stat_calculation
+from crew_optimizer import CrewOptimizer, min_cost_assignment
+from metrics import METRICS, HuntProfiler, MetricsExporter
+from roll_log import ROLL_ACCEPT, ROLL_CREATE, ROLL_DELETE, ROLL_REROLL, RollLog
 
 BASE_URL = config.links["base_url"]
 WORLD_MAP_URL = config.links["world_map_url"]
-LOG_FOLDER = os.getcwd() + "\logs"
+COMBAT_WS_SCHEME = "wss"
+COMBAT_WS_PORT = 3443
+LOG_FOLDER = os.path.join(os.getcwd(), "logs")
 
+CREW_CREATE_COST = 1000
+CREW_REROLL_COST = 800
 
+
+@functools.lru_cache(maxsize=None)
 def get_salt(seed):
     d = []
-    for i in range(len(seed) - 1, -1, -1):
-        c = 90 - ord(seed[i]) + 97
+    for ch in seed:
+        c = 90 - ord(ch) + 97
         if c == 139:
             c -= 91
         elif c >= 130:
             c -= 81
-        d.insert(0, chr(c))
+        d.append(chr(c))
     return "".join(d)
 
 
+@functools.lru_cache(maxsize=None)
+def _salted_md5(seed):
+    """
+    md5 context already fed with the salt of seed. Copied per request, never updated in place.
+    """
+    return hashlib.md5(get_salt(seed=seed).encode())
+
+
 def get_num(n: int):
     return (n % 11) * n
 
 
 def get_hash(seed, params_string: str, random_seed: int, secure: bool):
     num = get_num(n=random_seed)
+    raw = (params_string + str(num)).encode()
     if secure:
-        salt = get_salt(seed=seed)
-        raw = salt + params_string + str(num)
-    else:
-        raw = params_string + str(num)
+        h = _salted_md5(seed=seed).copy()
+        h.update(raw)
+        return h.hexdigest()
+
+    return hashlib.md5(raw).hexdigest()
+
+
+def sign_batch(seed, params_strings: list, secure: bool = True):
+    """
+    Signs many param strings at once.
 
-    return hashlib.md5(raw.encode()).hexdigest()
+    Args:
+        seed (str): Hash seed.
+        params_strings (list): Param strings to sign.
+        secure (bool): Prefix the salt of seed.
+
+    Returns:
+        List (int, str): (hn, h) pair for every param string.
+    """
+    base = _salted_md5(seed=seed) if secure else hashlib.md5()
+    randint = random.randint
+    result = []
+    for params_string in params_strings:
+        hn = randint(0, 9999999)
+        h = base.copy()
+        h.update((params_string + str(get_num(n=hn))).encode())
+        result.append((hn, h.hexdigest()))
+    return result
 
 
 def _get_headers():
@@ -54,15 +103,672 @@ def _get_headers():
     }
 
 
+def _send(session, metrics, endpoint, method, url, **kwargs):
+    """
+    Sends a request through session and records its latency, status and size in metrics.
+
+    Returns:
+        resp (Response): Server response.
+    """
+    start = time.perf_counter()
+    try:
+        resp = session.request(method, url, **kwargs)
+    except Exception:
+        metrics.record(endpoint, time.perf_counter() - start)
+        raise
+    metrics.record(
+        endpoint, time.perf_counter() - start, resp.status_code, len(resp.content)
+    )
+    return resp
+
+
+class AsyncEngine:
+    """
+    asyncio request engine with a bounded connection pool, used by the pipelined crew rolls of CrewManager.
+    FleetManager only shares its request metrics, hunting runs one thread per fleet on the sync session.
+
+    The aiohttp session is opened lazily inside the running event loop, so one engine can be
+    handed to both managers before the loop starts.
+    """
+
+    def __init__(self, pool_size: int = 20, timeout: float = 30, metrics=METRICS):
+        """
+        AsyncEngine constructor
+
+        Args:
+            pool_size (int): Maximum number of open connections.
+            timeout (float): Total timeout of a single request, in seconds.
+            metrics (RequestMetrics): Where requests are recorded.
+        """
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.metrics = metrics
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=_get_headers(),
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def request(self, method: str, url: str, params=None, data=None, json=None):
+        """
+        Sends a request through the pool.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Request url.
+            params (dict): Request query string parameters.
+            data (dict): Request form data.
+            json (dict): Request json body.
+
+        Returns:
+            resp (dict): Response data in json format.
+        """
+        if params is not None:
+            params = {k: str(v) for k, v in params.items()}
+        if data is not None:
+            data = {k: str(v) for k, v in data.items()}
+        path = urlsplit(url).path
+        start = time.perf_counter()
+        try:
+            async with self._get_session().request(
+                method, url, params=params, data=data, json=json
+            ) as resp:
+                body = await resp.read()
+        except Exception:
+            self.metrics.record(path, time.perf_counter() - start)
+            raise
+        self.metrics.record(path, time.perf_counter() - start, resp.status, len(body))
+        resp.raise_for_status()
+        return _json.loads(body)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class UraniumLedger:
+    """
+    ***Thread-locked***. Local uranium balance with reservation semantics.
+
+    Costs are reserved before a request and committed or refunded once its response arrives.
+    The balance is reconciled with the server every reconcile_every commits, every
+    reconcile_interval seconds, or right away when the last reconcile showed the server
+    holding less than the ledger predicted.
+
+    A reconcile is taken in two steps: self.begin_reconcile snapshots the ledger when the balance
+    request is sent and self.reconcile applies the response against that snapshot. Reservations in
+    flight at the snapshot are assumed to be charged in the server balance, they are not counted again
+    when they are committed afterwards.
+    """
+
+    def __init__(
+        self,
+        reconcile_every: int = 50,
+        reconcile_interval: float = 300,
+        drift_tolerance: int = CREW_CREATE_COST,
+    ):
+        """
+        UraniumLedger constructor
+
+        Args:
+            reconcile_every (int): Commits between server reconciles.
+            reconcile_interval (float): Seconds between server reconciles.
+            drift_tolerance (int): Allowed overestimate of the local balance, in uranium.
+        """
+        self.reconcile_every = reconcile_every
+        self.reconcile_interval = reconcile_interval
+        self.drift_tolerance = drift_tolerance
+
+        self.lock = threading.Lock()
+        self.balance = 0
+        self.spent = 0
+        self.held = 0
+        self.drift = 0
+        self._spent_base = 0
+        self._commits = 0
+        self._reconciled_at = 0.0
+        self._requests = 0
+        self._applied = 0
+        self._pending = 0
+
+    @property
+    def available(self):
+        return self.balance - (self.spent - self._spent_base) - self.held
+
+    def reserve(self, amount: int, floor: int = 0):
+        """
+        Holds amount of uranium, if the available balance is not below floor.
+
+        Args:
+            amount (int): Uranium to hold.
+            floor (int): Minimum available balance required to reserve.
+
+        Returns:
+            _ (bool): True if the amount was reserved.
+        """
+        with self.lock:
+            if self.available < floor:
+                return False
+            self.held += amount
+            return True
+
+    def commit(self, amount: int):
+        """
+        Turns a reservation into spent uranium.
+        """
+        with self.lock:
+            self.held -= amount
+            self.spent += amount
+            self._commits += 1
+
+    def refund(self, amount: int):
+        """
+        Releases a reservation without spending it.
+        """
+        with self.lock:
+            self.held -= amount
+
+    def begin_reconcile(self):
+        """
+        Snapshots the ledger right before the balance request is sent.
+
+        Returns:
+            Tuple: Snapshot to pass to self.reconcile or self.cancel_reconcile.
+        """
+        with self.lock:
+            self._requests += 1
+            self._pending += 1
+            return self._requests, self.available, self.spent, self.held
+
+    def cancel_reconcile(self, snapshot):
+        """
+        Drops a snapshot whose balance request failed.
+        """
+        with self.lock:
+            self._pending -= 1
+
+    def reconcile(self, balance: int, snapshot=None):
+        """
+        Replaces the local balance with the server balance. Reservations in flight are kept.
+
+        Args:
+            balance (int): Uranium balance reported by the server.
+            snapshot (Tuple): Result of self.begin_reconcile taken when the request was sent, now if None.
+        """
+        if snapshot is None:
+            snapshot = self.begin_reconcile()
+        number, predicted, spent, held = snapshot
+        with self.lock:
+            self._pending -= 1
+            if number < self._applied:
+                # A newer balance was applied already.
+                return
+            self._applied = number
+            self.drift = predicted - balance
+            # Holds in flight at the snapshot are in balance, committing them later must net to zero.
+            self.balance = balance + held
+            self._spent_base = spent
+            self._commits = 0
+            self._reconciled_at = time.monotonic()
+
+    def needs_reconcile(self):
+        """
+        Returns:
+            _ (bool): True if a reconcile is due and none is in flight.
+        """
+        with self.lock:
+            return not self._pending and (
+                self._commits >= self.reconcile_every
+                or time.monotonic() - self._reconciled_at >= self.reconcile_interval
+                or self.drift > self.drift_tolerance
+            )
+
+
+class FleetRecord:
+    """
+    Parsed fleet entry of a users/{userid}/dock/base/fleets response.
+
+    Ship slots are built once per fetch, launch payloads and ship id maps are shared projections of them.
+    Records are treated as read-only, a new fetch produces new records.
+    """
+
+    __slots__ = ("id", "is_on_map", "map_id", "ships", "ship_map", "launch_payload")
+
+    def __init__(self, fleet: dict):
+        """
+        FleetRecord constructor
+
+        Args:
+            fleet (dict): Fleet object from the fleets response.
+        """
+        self.id = fleet["id"]
+        self.is_on_map = bool(fleet["is_on_map"])
+        self.map_id = fleet.get("mapId")
+        self.ships = {
+            ship["actives"]["fltp"]: {"id": int(ship["actives"]["id"]), "dock": "base"}
+            for ship in fleet["ships"]
+        }
+        self.ship_map = {"ships": self.ships}
+        self.launch_payload = {"ships": self.ships, "launch": "worldmap"}
+
+
+def parse_fleets(response: dict):
+    """
+    Indexes a fleets response by fleet id.
+
+    Args:
+        response (dict): users/{userid}/dock/base/fleets response data.
+
+    Returns:
+        fleets (dict): fleet id -> FleetRecord.
+    """
+    return {fleet["id"]: FleetRecord(fleet) for fleet in response.get("fleets", [])}
+
+
+class TargetSet:
+    """
+    Bookmarks of a locator / vengeance response as arrays, built once per fetch
+    and ranked against any number of fleet positions.
+    """
+
+    __slots__ = ("bookmarks", "ids", "x", "y", "levels", "alive", "_index", "_grid")
+
+    def __init__(self, bookmarks: list):
+        """
+        TargetSet constructor
+
+        Args:
+            bookmarks (list): Bookmark objects of the response.
+        """
+        count = len(bookmarks)
+        self.bookmarks = bookmarks
+        self.ids = [target["id"] for target in bookmarks]
+        self.x = np.fromiter(
+            (target["x"] * 100 for target in bookmarks), dtype=float, count=count
+        )
+        self.y = np.fromiter(
+            (target["y"] * 100 for target in bookmarks), dtype=float, count=count
+        )
+        self.levels = np.fromiter(
+            (target["level"] for target in bookmarks), dtype=float, count=count
+        )
+        self.alive = np.ones(count, dtype=bool)
+        self._index = {target_id: i for i, target_id in enumerate(self.ids)}
+        self._grid = None
+
+    def __len__(self):
+        return len(self.bookmarks)
+
+    def discard(self, target_id):
+        """
+        Excludes a target from later rankings.
+
+        Args:
+            target_id: Bookmark id of the target.
+        """
+        i = self._index.get(target_id)
+        if i is not None:
+            self.alive[i] = False
+
+    def _candidates(self, idx, dist):
+        return [self.candidate(i, dist[i]) for i in idx]
+
+    def grid(self):
+        """
+        Returns:
+            TargetGrid: Spatial index over this set, built on first use.
+        """
+        if self._grid is None:
+            self._grid = TargetGrid(self)
+        return self._grid
+
+    def candidate(self, i, dist):
+        """
+        Returns:
+            Tuple: (x, y, distance, id) of target i.
+        """
+        target = self.bookmarks[i]
+        return target["x"], target["y"], float(dist), target["id"]
+
+    def rank(self, positions, level=False, max_distance=30000, limit=None):
+        """
+        Ranks the targets by distance for every position at once.
+
+        Args:
+            positions (list): (x, y) positions to rank against.
+            level (int): Keep only targets of this level, all levels if False.
+            max_distance (float): Drop targets further away than this.
+            limit (int): Keep only the limit closest targets per position.
+
+        Returns:
+            List (List): Per position, (x, y, distance, id) tuples sorted by distance.
+        """
+        pos = np.asarray(positions, dtype=float).reshape(-1, 2)
+        dist = np.hypot(pos[:, :1] - self.x, pos[:, 1:] - self.y)
+        keep = (dist <= max_distance) & self.alive
+        if level:
+            keep &= self.levels == level
+
+        ranked = []
+        for row, mask in zip(dist, keep):
+            idx = np.flatnonzero(mask)
+            if limit is not None and limit < len(idx):
+                idx = idx[np.argpartition(row[idx], limit - 1)[:limit]]
+            idx = idx[np.argsort(row[idx], kind="stable")]
+            ranked.append(self._candidates(idx, row))
+        return ranked
+
+
+class TargetGrid:
+    """
+    Uniform grid over the targets of a TargetSet, for nearest-target queries that only look at nearby cells.
+    """
+
+    __slots__ = ("targets", "cell", "cells", "bounds")
+
+    def __init__(self, targets: TargetSet, cell: float = 10000):
+        """
+        TargetGrid constructor
+
+        Args:
+            targets (TargetSet): Indexed targets.
+            cell (float): Cell edge length, in move units.
+        """
+        self.targets = targets
+        self.cell = cell
+        self.cells = defaultdict(list)
+        cx = np.floor(targets.x / cell).astype(np.int64).tolist()
+        cy = np.floor(targets.y / cell).astype(np.int64).tolist()
+        for i, key in enumerate(zip(cx, cy)):
+            self.cells[key].append(i)
+        if cx:
+            self.bounds = (min(cx), max(cx), min(cy), max(cy))
+        else:
+            self.bounds = (0, -1, 0, -1)
+
+    def _ring(self, qx, qy, r):
+        if r == 0:
+            yield qx, qy
+            return
+        for dx in range(-r, r + 1):
+            yield qx + dx, qy - r
+            yield qx + dx, qy + r
+        for dy in range(-r + 1, r):
+            yield qx - r, qy + dy
+            yield qx + r, qy + dy
+
+    def within(self, x, y, max_distance):
+        """
+        Indexes of the targets in the cells overlapping the square of half-width max_distance around (x, y).
+        Distances are not checked, dead targets are included.
+
+        Args:
+            x (float): Query x, in move units.
+            y (float): Query y, in move units.
+            max_distance (float): Query radius, in move units.
+
+        Returns:
+            np.ndarray: Target indexes, ascending.
+        """
+        min_x, max_x, min_y, max_y = self.bounds
+        lo_x = max(math.floor((x - max_distance) / self.cell), min_x)
+        hi_x = min(math.floor((x + max_distance) / self.cell), max_x)
+        lo_y = max(math.floor((y - max_distance) / self.cell), min_y)
+        hi_y = min(math.floor((y + max_distance) / self.cell), max_y)
+        if lo_x > hi_x or lo_y > hi_y:
+            return np.empty(0, dtype=np.int64)
+
+        if (hi_x - lo_x + 1) * (hi_y - lo_y + 1) > len(self.cells):
+            keys = (
+                key
+                for key in self.cells
+                if lo_x <= key[0] <= hi_x and lo_y <= key[1] <= hi_y
+            )
+        else:
+            keys = (
+                (cx, cy) for cx in range(lo_x, hi_x + 1) for cy in range(lo_y, hi_y + 1)
+            )
+        idx = [i for key in keys for i in self.cells.get(key, ())]
+        idx.sort()
+        return np.array(idx, dtype=np.int64)
+
+    def nearest(self, x, y, accept=None, max_distance=math.inf):
+        """
+        Finds the closest target that is alive and accepted.
+
+        Args:
+            x (float): Query x, in move units.
+            y (float): Query y, in move units.
+            accept (callable): Takes a target index, returns False to skip the target.
+            max_distance (float): Ignore targets further away than this.
+
+        Returns:
+            Tuple (int, float): Target index and distance, (None, None) if nothing qualifies.
+        """
+        min_x, max_x, min_y, max_y = self.bounds
+        if min_x > max_x:
+            return None, None
+
+        targets = self.targets
+        qx = math.floor(x / self.cell)
+        qy = math.floor(y / self.cell)
+        rings = max(abs(qx - min_x), abs(qx - max_x), abs(qy - min_y), abs(qy - max_y))
+        if max_distance != math.inf:
+            rings = min(rings, math.ceil(max_distance / self.cell) + 1)
+
+        best_i, best_d = None, max_distance
+        for r in range(rings + 1):
+            if best_i is not None and (r - 1) * self.cell > best_d:
+                break
+            for key in self._ring(qx, qy, r):
+                for i in self.cells.get(key, ()):
+                    if not targets.alive[i] or (accept is not None and not accept(i)):
+                        continue
+                    d = math.hypot(x - targets.x[i], y - targets.y[i])
+                    if d < best_d or (d == best_d and (best_i is None or i < best_i)):
+                        best_i, best_d = i, d
+
+        if best_i is None:
+            return None, None
+        return best_i, best_d
+
+
+class CycleEstimator:
+    """
+    ***Thread-locked***. Battle and repair durations learned per fleet, used to estimate full hunt cycle times.
+    Durations are exponential moving averages of observed values.
+    """
+
+    def __init__(
+        self, battle_time: float = 30, repair_time: float = 0, alpha: float = 0.3
+    ):
+        """
+        CycleEstimator constructor
+
+        Args:
+            battle_time (float): Battle duration assumed before any battle was observed, in seconds.
+            repair_time (float): Repair wait beyond the free speed-ups assumed before any repair was observed, in seconds.
+            alpha (float): Weight of the newest observation.
+        """
+        self.default_battle_time = battle_time
+        self.default_repair_time = repair_time
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.battle = {}
+        self.repair = {}
+
+    def _observe(self, store, fleet_id, seconds):
+        with self.lock:
+            prev = store.get(fleet_id)
+            if prev is None:
+                store[fleet_id] = seconds
+            else:
+                store[fleet_id] = prev + self.alpha * (seconds - prev)
+
+    def observe_battle(self, fleet_id, seconds: float):
+        self._observe(self.battle, fleet_id, seconds)
+
+    def observe_repair(self, fleet_id, seconds: float):
+        self._observe(self.repair, fleet_id, seconds)
+
+    def battle_time(self, fleet_id, default=None):
+        with self.lock:
+            return self.battle.get(
+                fleet_id, self.default_battle_time if default is None else default
+            )
+
+    def repair_time(self, fleet_id, default=None):
+        with self.lock:
+            return self.repair.get(
+                fleet_id, self.default_repair_time if default is None else default
+            )
+
+
+class RepairScheduler:
+    """
+    ***Thread-locked***. Queues repairs per gs_fleet_id repair slot.
+
+    Repairs sharing a slot run one after another in submission order, repairs on distinct slots run concurrently.
+    The returned future is resolved once the repair, including its speed-ups, is done.
+    Fleet threads queue through FleetManager.repair_and_wait, which parks them until the completion callback fires.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._slots = {}
+
+    def submit(self, gs_fleet_id, repair, /, *args, **kwargs):
+        """
+        Queues a repair on the slot of gs_fleet_id.
+
+        Args:
+            gs_fleet_id (str): Repair slot fleet id.
+            repair (callable): Repair to run, e.g. FleetManager.lazy_repair.
+
+        Returns:
+            concurrent.futures.Future: Result of the repair.
+        """
+        with self.lock:
+            slot = self._slots.get(gs_fleet_id)
+            if slot is None:
+                slot = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f"repair-{gs_fleet_id}"
+                )
+                self._slots[gs_fleet_id] = slot
+        return slot.submit(repair, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True):
+        with self.lock:
+            slots = list(self._slots.values())
+            self._slots.clear()
+        for slot in slots:
+            slot.shutdown(wait=wait)
+
+
+class TargetCache:
+    """
+    ***Thread-locked***. Target sets shared by all hunting fleets, keyed by request.
+
+    Entries live for ttl seconds. Only one fetch per key is in flight, other callers wait for its result.
+    Claimed targets are pruned from every cached set.
+    """
+
+    def __init__(self, ttl: float = 10):
+        """
+        TargetCache constructor
+
+        Args:
+            ttl (float): Seconds a fetched target set is shared.
+        """
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self._entries = {}
+        self._inflight = {}
+
+    def get(self, key, fetch):
+        """
+        Returns the cached target set of key, fetching it if it is missing or expired.
+
+        Args:
+            key (tuple): Cache key, e.g. ("locator", level, types).
+            fetch (callable): Returns a fresh TargetSet.
+
+        Returns:
+            TargetSet: Shared target set.
+        """
+        while True:
+            with self.lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > time.monotonic():
+                    return entry[1]
+                event = self._inflight.get(key)
+                leader = event is None
+                if leader:
+                    event = threading.Event()
+                    self._inflight[key] = event
+
+            if not leader:
+                event.wait()
+                continue
+
+            try:
+                targets = fetch()
+                with self.lock:
+                    self._entries[key] = (time.monotonic() + self.ttl, targets)
+                return targets
+            finally:
+                with self.lock:
+                    del self._inflight[key]
+                event.set()
+
+    def prune(self, target_id):
+        """
+        Removes a claimed target from every cached target set.
+
+        Args:
+            target_id: Bookmark id of the target.
+        """
+        with self.lock:
+            for _, targets in self._entries.values():
+                targets.discard(target_id)
+
+    def invalidate(self, key=None):
+        """
+        Drops one cached key, or all of them.
+        """
+        with self.lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
 class CrewManager:
-    def __init__(self, session):
+    def __init__(self, session, engine=None, roll_log: RollLog = None):
         """
         CrewManager constructor
 
         Args:
             session (session): The session object. Used for interacting with the game server.
+            engine (AsyncEngine): Request engine used by the *_async methods.
+            roll_log (RollLog): Persistent log of every crew roll, None to keep no log.
         """
         self.session = session
+        self.roll_log = roll_log
+        self.engine = engine if engine is not None else AsyncEngine()
+        self.metrics = self.engine.metrics
         self.userid = config.configs_main["userid"]
         self.seed = config.seeds["base"]
         self.game_signed_request = config.configs_main["game_signed_request"]
@@ -72,7 +778,7 @@ class CrewManager:
         self.blacklist = config.blacklist_crews
         self.crew_names = config.crews
 
-        self.uranium_storage = 0
+        self.ledger = UraniumLedger()
         self.uranium_limit = 1000
         self.remaining_slots = 0
         self.crew_storage = []
@@ -90,6 +796,9 @@ class CrewManager:
         self.roll_history_counts = defaultdict(list)
         self.last_gold_roll = defaultdict(int)
 
+        self.status_interval = 10
+        self._status_printed = 0.0
+
     def _calc_h_hn(self, params_string, seed):
         hn = random.randint(0, 9999999)
         h = get_hash(
@@ -123,7 +832,7 @@ class CrewManager:
             string += str(params["id"])
         return string
 
-    def _make_request(
+    def _prepare_request(
         self,
         endpoint: str,
         params: dict,
@@ -132,7 +841,7 @@ class CrewManager:
         action: int,
     ):
         """
-        Forms a request that is then sent to the game server.
+        Forms a signed request, shared by self._make_request and self._make_request_async.
 
         Args:
             endpoint (str): Request endpoint.
@@ -149,7 +858,7 @@ class CrewManager:
                             6 - assign
 
         Returns:
-            resp (dict): Response data in json format.
+            Tuple (str, str, dict): Method, url, request keyword arguments.
         """
         ts = int(time.time())
         param_string = self._generate_hash_string(params=payload, action=action)
@@ -164,16 +873,105 @@ class CrewManager:
             }
         )
 
-        payload.update({"hn": str(hn), "h": h})
+        payload.update({"hn": str(hn), "h": h})
+
+        url = f"{BASE_URL}/{endpoint}"
+        if post:
+            return "POST", url, {"params": params, "data": payload}
+        return "GET", url, {"params": params}
+
+    def _make_request(
+        self,
+        endpoint: str,
+        params: dict,
+        payload: dict,
+        post: bool,
+        action: int,
+    ):
+        """
+        Forms a request that is then sent to the game server.
+
+        Args:
+            endpoint (str): Request endpoint.
+            params (dict): Request query string parameters.
+            payload (dict): Request form data.
+            post (bool): Is request a Post or a Get.
+            action (int): Number associated with an action. See self._prepare_request.
+
+        Returns:
+            resp (dict): Response data in json format.
+        """
+        method, url, kwargs = self._prepare_request(
+            endpoint=endpoint, params=params, payload=payload, post=post, action=action
+        )
+        resp = _send(self.session, self.metrics, endpoint, method, url, **kwargs)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def _make_request_async(
+        self,
+        endpoint: str,
+        params: dict,
+        payload: dict,
+        post: bool,
+        action: int,
+    ):
+        """
+        Awaitable self._make_request, sent through self.engine.
+
+        Returns:
+            resp (dict): Response data in json format.
+        """
+        method, url, kwargs = self._prepare_request(
+            endpoint=endpoint, params=params, payload=payload, post=post, action=action
+        )
+        return await self.engine.request(method, url, **kwargs)
+
+    @property
+    def uranium_storage(self):
+        return self.ledger.available
 
-        url = f"{BASE_URL}/{endpoint}"
-        if post:
-            resp = self.session.post(url, params=params, data=payload)
+    def _spend(self, cost: int, endpoint: str, payload: dict, action: int):
+        """
+        Sends a paid request. cost must already be reserved on self.ledger,
+        it is committed if the response holds a purchase and refunded otherwise.
+
+        Returns:
+            resp (dict): Response data in json format.
+        """
+        try:
+            resp = self._make_request(
+                endpoint=endpoint, params={}, payload=payload, post=True, action=action
+            )
+        except Exception:
+            self.ledger.refund(cost)
+            raise
+        if "purchase" in resp:
+            self.ledger.commit(cost)
         else:
-            resp = self.session.get(url, params=params)
+            self.ledger.refund(cost)
+        return resp
 
-        resp.raise_for_status()
-        return resp.json()
+    async def _spend_async(self, cost: int, endpoint: str, payload: dict, action: int):
+        """
+        Awaitable self._spend.
+
+        Returns:
+            resp (dict): Response data in json format.
+        """
+        try:
+            resp = await self._make_request_async(
+                endpoint=endpoint, params={}, payload=payload, post=True, action=action
+            )
+        except BaseException:
+            # Also refunds a reservation whose request was cancelled.
+            self.ledger.refund(cost)
+            raise
+        if "purchase" in resp:
+            self.ledger.commit(cost)
+        else:
+            self.ledger.refund(cost)
+        return resp
 
     def _set_uranium(self):
         """
@@ -184,10 +982,37 @@ class CrewManager:
         """
         endpoint = config.links["currency"]
         payload = {"userid": self.userid, "currencyid": 1}
-        resp = self._make_request(
-            endpoint=endpoint, params={}, payload=payload, post=True, action=4
-        )
-        self.uranium_storage = resp["balances"]["1"]["amount"]
+        snapshot = self.ledger.begin_reconcile()
+        try:
+            resp = self._make_request(
+                endpoint=endpoint, params={}, payload=payload, post=True, action=4
+            )
+            balance = resp["balances"]["1"]["amount"]
+        except Exception:
+            self.ledger.cancel_reconcile(snapshot)
+            raise
+        self.ledger.reconcile(balance, snapshot)
+        return resp
+
+    async def _set_uranium_async(self):
+        """
+        Awaitable self._set_uranium.
+
+        Returns:
+            resp (dict): Response data in json format.
+        """
+        endpoint = config.links["currency"]
+        payload = {"userid": self.userid, "currencyid": 1}
+        snapshot = self.ledger.begin_reconcile()
+        try:
+            resp = await self._make_request_async(
+                endpoint=endpoint, params={}, payload=payload, post=True, action=4
+            )
+            balance = resp["balances"]["1"]["amount"]
+        except Exception:
+            self.ledger.cancel_reconcile(snapshot)
+            raise
+        self.ledger.reconcile(balance, snapshot)
         return resp
 
     def _set_crews(self):
@@ -208,20 +1033,34 @@ class CrewManager:
     def _create_crew(self):
         """
         Send a request to game server, to create a crew transaction.
+        CREW_CREATE_COST must be reserved on self.ledger beforehand.
 
         Returns:
             resp (dict): Response data in json format.
         """
         endpoint = config.links["create"]
         payload = {"packId": "9"}
-        self.uranium_storage -= 1000
-        return self._make_request(
-            endpoint=endpoint, params={}, payload=payload, post=True, action=0
+        return self._spend(
+            cost=CREW_CREATE_COST, endpoint=endpoint, payload=payload, action=0
+        )
+
+    async def _create_crew_async(self):
+        """
+        Awaitable self._create_crew.
+
+        Returns:
+            resp (dict): Response data in json format.
+        """
+        endpoint = config.links["create"]
+        payload = {"packId": "9"}
+        return await self._spend_async(
+            cost=CREW_CREATE_COST, endpoint=endpoint, payload=payload, action=0
         )
 
     def _reroll_crew(self, transaction_id: int):
         """
-        Send a request to game server, to create a crew transaction.
+        Send a request to game server, to reroll a crew transaction.
+        CREW_REROLL_COST must be reserved on self.ledger beforehand.
 
         Args:
             transaction_id (int): id of the transaction.
@@ -231,9 +1070,24 @@ class CrewManager:
         """
         endpoint = config.links["reroll"]
         payload = {"transactionId": transaction_id}
-        self.uranium_storage -= 800
-        return self._make_request(
-            endpoint=endpoint, params={}, payload=payload, post=True, action=1
+        return self._spend(
+            cost=CREW_REROLL_COST, endpoint=endpoint, payload=payload, action=1
+        )
+
+    async def _reroll_crew_async(self, transaction_id: int):
+        """
+        Awaitable self._reroll_crew.
+
+        Args:
+            transaction_id (int): id of the transaction.
+
+        Returns:
+            resp (dict): Response data in json format.
+        """
+        endpoint = config.links["reroll"]
+        payload = {"transactionId": transaction_id}
+        return await self._spend_async(
+            cost=CREW_REROLL_COST, endpoint=endpoint, payload=payload, action=1
         )
 
     def _accept_crew(self, transaction_id: int):
@@ -252,6 +1106,22 @@ class CrewManager:
             endpoint=endpoint, params={}, payload=payload, post=True, action=2
         )
 
+    async def _accept_crew_async(self, transaction_id: int):
+        """
+        Awaitable self._accept_crew.
+
+        Args:
+            transaction_id (int): id of the transaction.
+
+        Returns:
+            resp (dict): Response data in json format.
+        """
+        endpoint = config.links["accept"]
+        payload = {"transactionId": transaction_id}
+        return await self._make_request_async(
+            endpoint=endpoint, params={}, payload=payload, post=True, action=2
+        )
+
     def _delete_crew(self, long_crew_id: int):
         """
         Send a request to game server, to delete a crew.
@@ -268,6 +1138,22 @@ class CrewManager:
             endpoint=endpoint, params={}, payload=payload, post=True, action=3
         )
 
+    async def _delete_crew_async(self, long_crew_id: int):
+        """
+        Awaitable self._delete_crew.
+
+        Args:
+            long_crew_id (int): long id of the crew.
+
+        Returns:
+            resp (dict): Response data in json format.
+        """
+        endpoint = config.links["delete"]
+        payload = {"id": long_crew_id}
+        return await self._make_request_async(
+            endpoint=endpoint, params={}, payload=payload, post=True, action=3
+        )
+
     def _assign_crew(self, long_crew_id: int, fleet_id: str):
         """
         Send a request to game server, to assign a crew to a fleet.
@@ -339,18 +1225,21 @@ class CrewManager:
         Returns:
             Tuple (int, int): Crew type, Long crew id
         """
-        if self.uranium_storage < self.uranium_limit or self.remaining_slots < 2:
+        if self.remaining_slots < 2 or not self.ledger.reserve(
+            CREW_CREATE_COST, floor=self.uranium_limit
+        ):
             self.can_roll[thread] = False
             return None, None
 
         resp = self._create_crew()
         transaction_id = int(resp["purchase"]["transactionId"])
         crew_id = int(resp["purchase"]["items"][0]["crew_id"])
+        self._log_roll(ROLL_CREATE, crew_id, CREW_CREATE_COST, thread)
 
         while crew_id not in self.whitelist:
             self.roll_history[thread][crew_id] += 1
 
-            if self.uranium_storage < self.uranium_limit:
+            if not self.ledger.reserve(CREW_REROLL_COST, floor=self.uranium_limit):
                 self.can_roll[thread] = False
                 self.delete_last_roll[thread] = True
                 break
@@ -358,19 +1247,103 @@ class CrewManager:
             resp = self._reroll_crew(transaction_id=transaction_id)
             transaction_id = int(resp["purchase"]["transactionId"])
             crew_id = int(resp["purchase"]["items"][0]["crew_id"])
+            self._log_roll(ROLL_REROLL, crew_id, CREW_REROLL_COST, thread)
 
         resp = self._accept_crew(transaction_id=transaction_id)
+        self._log_roll(ROLL_ACCEPT, crew_id, 0, thread)
+        return resp["item"]["crew_id"], resp["item"]["id"]
+
+    async def _roll_crew_async(self, thread: int):
+        """
+        Awaitable self._roll_crew. Each awaiting transaction yields the event loop,
+        so the next reroll of another transaction is sent as soon as its response arrives.
+
+        Args:
+            thread (int): Thread / pipeline slot number.
+
+        Returns:
+            Tuple (int, int): Crew type, Long crew id
+        """
+        if self.remaining_slots < 2 or not self.ledger.reserve(
+            CREW_CREATE_COST, floor=self.uranium_limit
+        ):
+            self.can_roll[thread] = False
+            return None, None
+
+        resp = await self._create_crew_async()
+        if "purchase" not in resp:
+            # Rejected, the reservation was refunded by self._spend_async.
+            self.can_roll[thread] = False
+            return None, None
+        transaction_id = int(resp["purchase"]["transactionId"])
+        crew_id = int(resp["purchase"]["items"][0]["crew_id"])
+        self._log_roll(ROLL_CREATE, crew_id, CREW_CREATE_COST, thread)
+
+        while crew_id not in self.whitelist:
+            self.roll_history[thread][crew_id] += 1
+
+            if not self.ledger.reserve(CREW_REROLL_COST, floor=self.uranium_limit):
+                self.can_roll[thread] = False
+                self.delete_last_roll[thread] = True
+                break
+
+            resp = await self._reroll_crew_async(transaction_id=transaction_id)
+            if "purchase" not in resp:
+                self.can_roll[thread] = False
+                return None, None
+            transaction_id = int(resp["purchase"]["transactionId"])
+            crew_id = int(resp["purchase"]["items"][0]["crew_id"])
+            self._log_roll(ROLL_REROLL, crew_id, CREW_REROLL_COST, thread)
+
+        resp = await self._accept_crew_async(transaction_id=transaction_id)
+        self._log_roll(ROLL_ACCEPT, crew_id, 0, thread)
         return resp["item"]["crew_id"], resp["item"]["id"]
 
-    def _print_status(self):
+    def _log_roll(self, flags: int, crew_id: int, uranium: int, thread: int):
+        """
+        Appends one step of a crew transaction to self.roll_log, if set.
+
+        Args:
+            flags (int): ROLL_CREATE, ROLL_REROLL, ROLL_ACCEPT or ROLL_DELETE.
+            crew_id (int): Crew type.
+            uranium (int): Uranium spent on the step.
+            thread (int): Thread number.
+        """
+        if self.roll_log is not None:
+            self.roll_log.record(flags, crew_id, uranium=uranium, thread=thread)
+
+    def _print_status(self, force: bool = False):
         """
-        Print information about the current crew roll session.
+        Print information about the current crew roll session, at most once every self.status_interval seconds.
+
+        Args:
+            force (bool): Print even if the last status was printed less than self.status_interval seconds ago.
         """
+        now = time.monotonic()
+        if not force and now - self._status_printed < self.status_interval:
+            return
+        self._status_printed = now
         print(f"====== Crew Status ======")
         print(f"Rolls : {self.status[0]}")
         for key, value in self.status.items():
             if key in self.whitelist:
-                print(f"{self.crew_names[key]} : {value}")
+                print(f"{self.crew_names.get(key, key)} : {value}")
+
+    def optimize_whitelist(self, profiles, top: int = 2):
+        """
+        Replaces the whitelist rolled for with the best crews of profiles, see CrewOptimizer.suggest_whitelist.
+
+        Args:
+            profiles (list | dict): ShipProfiles of the fleets crews are rolled for.
+            top (int): Crews kept per profile.
+
+        Returns:
+            set: New whitelist.
+        """
+        self.whitelist = CrewOptimizer(names=self.crew_names).suggest_whitelist(
+            profiles, top=top
+        )
+        return self.whitelist
 
     def _set_defaults(self, thread_count: int):
         """
@@ -406,8 +1379,11 @@ class CrewManager:
                     continue
 
             crew_id, crew_id_long = self._roll_crew(thread=thread)
+            if crew_id is None:
+                continue
             if self.delete_last_roll[thread]:
                 self._delete_crew(long_crew_id=crew_id_long)
+                self._log_roll(ROLL_DELETE, int(crew_id), 0, thread)
                 self.delete_last_roll[thread] = False
             else:
                 self.roll_history[thread][crew_id] += 1
@@ -417,7 +1393,88 @@ class CrewManager:
                 self.remaining_slots -= 1
                 self._print_status()
 
-            self._set_uranium()
+            if self.ledger.needs_reconcile():
+                self._set_uranium()
+        self._print_status(force=True)
+
+    async def _fill_crews_slot(self, timeout: float, thread: int):
+        """
+        One pipeline slot of self.fill_crews_async, same workflow as self.fill_crews.
+
+        Errors are handled per slot like the threads of self.fill_crews: the slot backs off
+        and re-reads the balance, the other slots keep rolling.
+
+        Args:
+            timeout (float): Time offset to the future.
+            thread (int): Pipeline slot number.
+        """
+        while time.time() < timeout and self.remaining_slots > 2:
+            try:
+                if not self.can_roll[thread]:
+                    if self.uranium_storage > self.uranium_limit:
+                        self.can_roll[thread] = True
+                    else:
+                        await asyncio.sleep(5)
+                        await self._set_uranium_async()
+                        continue
+
+                crew_id, crew_id_long = await self._roll_crew_async(thread=thread)
+                if crew_id is None:
+                    continue
+                if self.delete_last_roll[thread]:
+                    await self._delete_crew_async(long_crew_id=crew_id_long)
+                    self._log_roll(ROLL_DELETE, int(crew_id), 0, thread)
+                    self.delete_last_roll[thread] = False
+                else:
+                    self.roll_history[thread][crew_id] += 1
+                    self.status[crew_id] += 1
+                    self.status[0] += sum(self.roll_history[thread].values())
+                    self.roll_history[thread] = defaultdict(int)
+                    self.remaining_slots -= 1
+                    self._print_status()
+
+                if self.ledger.needs_reconcile():
+                    await self._set_uranium_async()
+            except Exception as e:
+                print(f"[Crew-{thread}] Roll error:", e)
+                self.can_roll[thread] = False
+                self.delete_last_roll[thread] = False
+                await asyncio.sleep(5)
+                try:
+                    await self._set_uranium_async()
+                except Exception as e:
+                    print(f"[Crew-{thread}] Balance error:", e)
+
+    async def fill_crews_async(self, timeout: float, window: int = 8):
+        """
+        Pipelined self.fill_crews. Keeps window independent crew transactions in flight on one event loop.
+        self._set_defaults(window) must be called beforehand, slots use thread numbers 0...window-1.
+
+        Args:
+            timeout (float): Time offset to the future.
+            window (int): Number of transactions in flight.
+        """
+        await asyncio.gather(
+            *(self._fill_crews_slot(timeout=timeout, thread=i) for i in range(window))
+        )
+        self._print_status(force=True)
+
+    def fill_crews_pipelined(self, timeout: float, window: int = 8):
+        """
+        Blocking entry point for self.fill_crews_async, runs its own event loop until done.
+
+        Args:
+            timeout (float): Time offset to the future.
+            window (int): Number of transactions in flight.
+        """
+
+        async def run():
+            try:
+                await self.fill_crews_async(timeout=timeout, window=window)
+            finally:
+                await self.engine.close()
+
+        asyncio.run(run())
 
     def flush_crews(self, blacklist: set):
         """
@@ -439,8 +1496,29 @@ class CrewManager:
 
 
 class FleetManager:
-    def __init__(self, session):
+    def __init__(
+        self,
+        session,
+        fleets_ttl: float = 5.0,
+        engine=None,
+        targets_ttl: float = 10.0,
+        profiler=None,
+    ):
+        """
+        FleetManager constructor
+
+        Args:
+            session (session): The session object. Used for interacting with the game server.
+            fleets_ttl (float): Seconds a fetched fleet snapshot is reused by self.get_fleets.
+            engine (AsyncEngine): Engine whose request metrics are shared with CrewManager.
+            targets_ttl (float): Seconds fetched targets are shared between hunting fleets.
+            profiler (HuntProfiler): Records the phase timings of every hunt cycle.
+        """
         self.session = session
+        self.engine = engine if engine is not None else AsyncEngine()
+        self.metrics = self.engine.metrics
+        self.profiler = profiler if profiler is not None else HuntProfiler()
+        self._local = threading.local()
         self.userid = config.configs_main["userid"]
         self.seed = config.seeds["base"]
         self.world_map_seed = config.seeds["world"]
@@ -456,10 +1534,35 @@ class FleetManager:
         self.ship_ids = defaultdict(str)
         self.claimed_targets = set()
         self.claim_lock = threading.Lock()
-        self.repair_lock = threading.Lock()
+        self.hunting = {}
+        self.assignments = {}
+        self.assign_lock = threading.Lock()
+        self.target_cache = TargetCache(ttl=targets_ttl)
+        self.fetch_pool = ThreadPoolExecutor(max_workers=4)
+        self.repair_scheduler = RepairScheduler()
+        self.ship_repair_times = {}
+        self.repair_stats = defaultdict(Stat_calculation.RepairStats)
+        self.repair_stats_lock = threading.Lock()
 
         self.positions = {}
         self.pos_lock = threading.Lock()
+        self.replay_stats = {}
+        self.cycles = CycleEstimator()
+        self.cycle_estimates = {}
+        self.battles = battle.BattleRuntime(
+            headers={
+                "Origin": BASE_URL,
+                "Cache-Control": "no-cache",
+                "Pragma": "no-cache",
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36 OPR/120.0.0.0",
+            }
+        )
+
+        self.fleets_ttl = fleets_ttl
+        self._fleets_snapshot = None
+        self._fleets_index = {}
+        self._fleets_expiry = 0.0
+        self.fleets_lock = threading.Lock()
 
         self.clock_map = {
             12: (-1, -1),
@@ -514,7 +1617,7 @@ class FleetManager:
                 string += params["types"]
         return string
 
-    def _make_request(
+    def _prepare_request(
         self,
         endpoint,
         params=None,
@@ -579,17 +1682,20 @@ class FleetManager:
 
         if post:
             if payload:
-                if action == 0 or action == 5:
-                    resp = self.session.post(url, params=params, json=payload)
-                elif action == 2:
-                    resp = self.session.post(url, params=params, data=payload)
-            else:
-                resp = self.session.post(url, params=params)
+                if action == 2:
+                    return "POST", url, {"params": params, "data": payload}
+                return "POST", url, {"params": params, "json": payload}
+            return "POST", url, {"params": params}
         elif put:
-            resp = self.session.put(url, params=params, json=payload)
-        else:
-            resp = self.session.get(url, params=params)
-
+            return "PUT", url, {"params": params, "json": payload}
+        return "GET", url, {"params": params}
+
+    def _make_request(self, endpoint, **kwargs):
+        method, url, request_kwargs = self._prepare_request(endpoint, **kwargs)
+        self._local.endpoint = endpoint
+        resp = _send(
+            self.session, self.metrics, endpoint, method, url, **request_kwargs
+        )
         resp.raise_for_status()
         return resp.json()
 
@@ -605,43 +1711,288 @@ class FleetManager:
     def _filter_by_distance(
         self, fecthed_targets, fleet_id, level=False, max_distance=30000
     ):
-        targets = []
-        for target in fecthed_targets["bookmarks"]:
-            dist = self._distance(
-                fleet_id=fleet_id,
-                target_x=target["x"] * 100,
-                target_y=target["y"] * 100,
+        if not isinstance(fecthed_targets, TargetSet):
+            fecthed_targets = TargetSet(fecthed_targets["bookmarks"])
+
+        targets = fecthed_targets.rank(
+            positions=[self._get_position(fleet_id=fleet_id)],
+            level=level,
+            max_distance=max_distance,
+        )[0]
+
+        if not targets:
+            return None
+
+        return targets
+
+    def _claim_target(self, target_id):
+        with self.claim_lock:
+            if target_id in self.claimed_targets:
+                return False
+            self.claimed_targets.add(target_id)
+        self.target_cache.prune(target_id)
+        return True
+
+    def _release_target(self, target_id):
+        with self.claim_lock:
+            self.claimed_targets.discard(target_id)
+
+    def _pick_target(self, targets):
+        for t in targets:
+            if self._claim_target(t[3]):
+                return t
+        return None
+
+    def _nearest_target(self, targets, fleet_id, level=False, max_distance=30000):
+        """
+        Claims the closest unclaimed target through the spatial index of targets.
+
+        Args:
+            targets (TargetSet): Targets to pick from.
+            fleet_id (str): fleet id. ("1"...."15")
+            level (int): Only targets of this level, all levels if False.
+            max_distance (float): Ignore targets further away than this.
+
+        Returns:
+            Tuple: Claimed (x, y, distance, id) target, None if nothing is free.
+        """
+        x, y = self._get_position(fleet_id=fleet_id)
+
+        def accept(i):
+            if level and targets.levels[i] != level:
+                return False
+            return targets.ids[i] not in self.claimed_targets
+
+        while True:
+            i, dist = targets.grid().nearest(
+                x=x, y=y, accept=accept, max_distance=max_distance
+            )
+            if i is None:
+                return None
+            if self._claim_target(targets.ids[i]):
+                return targets.candidate(i, dist)
+
+    def assign_targets(
+        self,
+        targets,
+        fleet_ids,
+        map_speeds,
+        level=False,
+        max_distance=30000,
+        base_repair=False,
+    ):
+        """
+        ***Thread-locked***. Claims one target for each fleet at once, minimizing the total travel time of all fleets.
+        Candidates are taken from the spatial index of targets around every fleet.
+
+        Args:
+            targets (TargetSet): Targets to assign.
+            fleet_ids (list): Fleets to assign targets to.
+            map_speeds (dict): fleet id -> map speed.
+            level (int): Only targets of this level, all levels if False.
+            max_distance (float): Ignore targets further away than this.
+            base_repair (dict | bool): fleet id -> fleet returns to base after every battle, the return leg is added to its cost.
+
+        Returns:
+            dict: fleet id -> claimed (x, y, distance, id) target. Fleets without a reachable target are left out.
+        """
+        if not fleet_ids:
+            return {}
+        with self.pos_lock:
+            positions = np.array(
+                [
+                    self.positions.get(fleet_id, (self.base_x, self.base_y))
+                    for fleet_id in fleet_ids
+                ],
+                dtype=float,
+            ).reshape(-1, 2)
+
+        grid = targets.grid()
+        idx = np.unique(
+            np.concatenate(
+                [grid.within(x=x, y=y, max_distance=max_distance) for x, y in positions]
+            )
+        )
+        speeds = np.array([map_speeds[fleet_id] for fleet_id in fleet_ids], float)
+        if not isinstance(base_repair, dict):
+            base_repair = dict.fromkeys(fleet_ids, base_repair)
+        returns = np.array([bool(base_repair[fleet_id]) for fleet_id in fleet_ids])
+
+        with self.claim_lock:
+            free = targets.alive[idx]
+            if level:
+                free &= targets.levels[idx] == level
+            free &= np.array(
+                [targets.ids[i] not in self.claimed_targets for i in idx.tolist()],
+                dtype=bool,
+            )
+            idx = idx[free]
+            dist = np.hypot(
+                positions[:, :1] - targets.x[idx], positions[:, 1:] - targets.y[idx]
+            )
+            back = np.hypot(targets.x[idx] - self.base_x, targets.y[idx] - self.base_y)
+            cost = self._travel_time(
+                distance=dist + returns[:, None] * back, map_speed=speeds[:, None]
             )
+            cost[dist > max_distance] = math.inf
+
+            assigned = {}
+            for row, col in enumerate(min_cost_assignment(cost)):
+                if col is None or not math.isfinite(cost[row, col]):
+                    continue
+                i = idx[col]
+                self.claimed_targets.add(targets.ids[i])
+                assigned[fleet_ids[row]] = targets.candidate(i, dist[row, col])
+
+        for target in assigned.values():
+            self.target_cache.prune(target[3])
+        return assigned
+
+    def _assigned_target(self, targets, fleet_id, level=False, max_distance=30000):
+        """
+        ***Thread-locked***. Takes the target assigned to fleet_id on targets.
+
+        Targets are assigned once per target set, to all fleets hunting it through self.hunt_targets,
+        with self.assign_targets. A fleet asking for a target on a set it holds no assignment on triggers a
+        new assignment for every fleet without one, assignments left over from older sets are released first.
+
+        Args:
+            targets (TargetSet): Current target set of the fleet.
+            fleet_id (str): fleet id. ("1"...."15")
+            level (int): Only targets of this level, all levels if False.
+            max_distance (float): Ignore targets further away than this.
+
+        Returns:
+            Tuple: Claimed (x, y, distance, id) target, None if the fleet got no target.
+        """
+        with self.assign_lock:
+            entry = self.assignments.get(fleet_id)
+            if entry is None or entry[0] is not targets:
+                key = self.hunting[fleet_id][0]
+                for other, (other_targets, target) in list(self.assignments.items()):
+                    if self.hunting[other][0] == key and other_targets is not targets:
+                        del self.assignments[other]
+                        self._release_target(target_id=target[3])
+                fleet_ids = [
+                    other
+                    for other, (other_key, _, _) in self.hunting.items()
+                    if other_key == key and other not in self.assignments
+                ]
+                assigned = self.assign_targets(
+                    targets=targets,
+                    fleet_ids=fleet_ids,
+                    map_speeds={f: self.hunting[f][1] for f in fleet_ids},
+                    level=level,
+                    max_distance=max_distance,
+                    base_repair={f: self.hunting[f][2] for f in fleet_ids},
+                )
+                for other, target in assigned.items():
+                    self.assignments[other] = (targets, target)
+            entry = self.assignments.pop(fleet_id, None)
+        return None if entry is None else entry[1]
+
+    def _estimate_cycles(
+        self,
+        targets,
+        fleet_id,
+        map_speed,
+        level=False,
+        max_distance=30000,
+        base_repair=False,
+        overhead=6,
+        repair_overhead=6,
+    ):
+        """
+        Estimates the full hunt cycle of every free target: outbound travel, battle,
+        and with base_repair the return leg and repair.
 
-            if dist > max_distance:
-                continue
+        Args:
+            targets (TargetSet): Candidate targets.
+            fleet_id (str): fleet id. ("1"...."15")
+            map_speed (float): Map speed of the fleet.
+            level (int): Only targets of this level, all levels if False.
+            max_distance (float): Ignore targets further away than this.
+            base_repair (bool): Fleet returns to base and repairs after every battle.
+            overhead (float): Fixed waits of a cycle, in seconds.
+            repair_overhead (float): Fixed waits around a repair, in seconds.
 
-            if level:
-                if target["level"] == level:
-                    targets.append((target["x"], target["y"], dist, target["id"]))
-            else:
-                targets.append((target["x"], target["y"], dist, target["id"]))
+        Returns:
+            List (dict): Estimates sorted by kills per hour, best first.
+        """
+        x, y = self._get_position(fleet_id=fleet_id)
+        with self.claim_lock:
+            free = targets.alive & np.array(
+                [target_id not in self.claimed_targets for target_id in targets.ids],
+                dtype=bool,
+            )
+        if level:
+            free &= targets.levels == level
+        idx = np.flatnonzero(free)
 
-        if not targets:
-            return None
+        dist = np.hypot(x - targets.x[idx], y - targets.y[idx])
+        near = dist <= max_distance
+        idx, dist = idx[near], dist[near]
 
-        return sorted(targets, key=lambda target: target[2])
+        outbound = self._travel_time(distance=dist, map_speed=map_speed)
+        battle_time = self.cycles.battle_time(fleet_id)
+        cycle = outbound + battle_time + overhead
+        if base_repair:
+            back = self._travel_time(
+                distance=np.hypot(
+                    targets.x[idx] - self.base_x, targets.y[idx] - self.base_y
+                ),
+                map_speed=map_speed,
+            )
+            repair_time = self.cycles.repair_time(fleet_id) + repair_overhead
+            cycle = cycle + back + repair_time
+        else:
+            back = np.zeros_like(dist)
+            repair_time = 0.0
+        kills_per_hour = 3600 / cycle
 
-    def _claim_target(self, target_id):
-        with self.claim_lock:
-            if target_id in self.claimed_targets:
-                return False
-            self.claimed_targets.add(target_id)
-            return True
+        estimates = []
+        for k in np.argsort(-kills_per_hour, kind="stable"):
+            estimates.append(
+                {
+                    "target": targets.candidate(idx[k], dist[k]),
+                    "outbound": float(outbound[k]),
+                    "battle": battle_time,
+                    "return": float(back[k]),
+                    "repair": repair_time,
+                    "cycle": float(cycle[k]),
+                    "kills_per_hour": float(kills_per_hour[k]),
+                }
+            )
+        return estimates
 
-    def _release_target(self, target_id):
-        with self.claim_lock:
-            self.claimed_targets.discard(target_id)
+    def _best_target(
+        self,
+        targets,
+        fleet_id,
+        map_speed,
+        level=False,
+        max_distance=30000,
+        base_repair=False,
+    ):
+        """
+        Claims the free target with the most kills per hour over a full hunt cycle.
+        The ranked estimates are kept in self.cycle_estimates[fleet_id].
 
-    def _pick_target(self, targets):
-        for t in targets:
-            if self._claim_target(t[3]):
-                return t
+        Returns:
+            Tuple: Claimed (x, y, distance, id) target, None if nothing is free.
+        """
+        estimates = self._estimate_cycles(
+            targets=targets,
+            fleet_id=fleet_id,
+            map_speed=map_speed,
+            level=level,
+            max_distance=max_distance,
+            base_repair=base_repair,
+        )
+        self.cycle_estimates[fleet_id] = estimates
+        for estimate in estimates:
+            if self._claim_target(estimate["target"][3]):
+                return estimate["target"]
         return None
 
     def _fetch_locator_targets(self, level, types):
@@ -654,31 +2005,58 @@ class FleetManager:
         }
         return self._make_request(endpoint, payload=payload, action=2, post=True)
 
+    def _locator_targets(self, level, types):
+        """
+        Locator targets shared between all fleets hunting the same level and types.
+
+        Returns:
+            TargetSet: Cached target set.
+        """
+        return self.target_cache.get(
+            key=("locator", level, types),
+            fetch=lambda: TargetSet(
+                self._fetch_locator_targets(level=level, types=types)["bookmarks"]
+            ),
+        )
+
+    def _vengeance_allowed(self, target):
+        return not (
+            target["rank"] == "3"
+            or target["rank"] == "4"
+            or (target["rank"] == "2" and target["level"] > 100)
+        )
+
+    def _fetch_vengeance_targets(self):
+        """
+        Fetches out-sector and in-sector vengeance bookmarks concurrently.
+
+        Returns:
+            TargetSet: Merged targets, deduplicated by id, without rank 3/4 and rank 2 above level 100.
+        """
+        futures = [
+            self.fetch_pool.submit(
+                self._make_request, endpoint, payload={}, action=2, post=True
+            )
+            for endpoint in (
+                "api/bm/bookmarks/vengeanceoutsector",
+                "api/bm/bookmarks/vengeanceinsector",
+            )
+        ]
+        seen = set()
+        bookmarks = []
+        for future in futures:
+            for target in future.result()["bookmarks"]:
+                if target["id"] in seen or not self._vengeance_allowed(target):
+                    continue
+                seen.add(target["id"])
+                bookmarks.append(target)
+        return TargetSet(bookmarks)
+
     def _vengence_targets(self, fleet_id):
-        endpoint = "api/bm/bookmarks/vengeanceoutsector"
-        payload = {}
-        resp = self._make_request(endpoint, payload=payload, action=2, post=True)
-        targets = {"bookmarks": []}
-        for target in resp["bookmarks"]:
-            if (
-                target["rank"] == "3"
-                or target["rank"] == "4"
-                or (target["rank"] == "2" and target["level"] > 100)
-            ):
-                continue
-            targets["bookmarks"].append(target)
-
-        endpoint = "api/bm/bookmarks/vengeanceinsector"
-        resp = self._make_request(endpoint, payload=payload, action=2, post=True)
-        for target in resp["bookmarks"]:
-            if (
-                target["rank"] == "3"
-                or target["rank"] == "4"
-                or (target["rank"] == "2" and target["level"] > 100)
-            ):
-                continue
-            targets["bookmarks"].append(target)
-        return self._filter_by_distance(resp, fleet_id, False, 50000)
+        targets = self.target_cache.get(
+            key=("vengeance",), fetch=self._fetch_vengeance_targets
+        )
+        return self._filter_by_distance(targets, fleet_id, False, 50000)
 
     def _get_approach_clock(self, fleet_id, target_x, target_y):
         last_x, last_y = self._get_position(fleet_id=fleet_id)
@@ -706,52 +2084,25 @@ class FleetManager:
         return best_h
 
     def _pre_launch_payload(self, fleet_id):
-        response = self.get_fleets()
-        fleet_payload = {
-            "ships": {},
-            "launch": "worldmap",
-        }
-        for k, v in response.items():
-            if k == "fleets":
-                for fleet in v:
-                    if fleet["id"] == fleet_id:
-                        for ship in fleet["ships"]:
-                            fleet_payload["ships"][ship["actives"]["fltp"]] = {
-                                "id": int(ship["actives"]["id"]),
-                                "dock": "base",
-                            }
-                break
-
-        return fleet_payload
+        fleet = self._get_fleet(fleet_id)
+        if fleet is None:
+            return {"ships": {}, "launch": "worldmap"}
+        return fleet.launch_payload
 
     def _get_ship_ids(self, fleet_id):
-        response = self.get_fleets()
-        fleet_payload = {
-            "ships": {},
-        }
-        for k, v in response.items():
-            if k == "fleets":
-                for fleet in v:
-                    if fleet["id"] == fleet_id:
-                        for ship in fleet["ships"]:
-                            fleet_payload["ships"][ship["actives"]["fltp"]] = {
-                                "id": int(ship["actives"]["id"]),
-                                "dock": "base",
-                            }
-                break
+        fleet = self._get_fleet(fleet_id)
+        fleet_payload = fleet.ship_map if fleet else {"ships": {}}
         if not self.ship_ids[fleet_id]:
             self.ship_ids[fleet_id] = fleet_payload
         return fleet_payload
 
-    def _fleet_docked(self, fleet_id):
-        response = self.get_fleets()
-        for k, v in response.items():
-            if k == "fleets":
-                for fleet in v:
-                    if fleet["id"] == fleet_id:
-                        if fleet["is_on_map"]:
-                            self.map_ids[fleet["id"]] = fleet["mapId"]
-                        return fleet["is_on_map"] == False
+    def _fleet_docked(self, fleet_id, refresh=False):
+        fleet = self._get_fleet(fleet_id, refresh=refresh)
+        if fleet is None:
+            return None
+        if fleet.is_on_map:
+            self.map_ids[fleet.id] = fleet.map_id
+        return not fleet.is_on_map
 
     def _fleet_in_combat(self, fleet_id, map_speed):
         last_x, last_y = self._get_position(fleet_id=fleet_id)
@@ -769,6 +2120,60 @@ class FleetManager:
             return str(combat_guid), int(engage_id), server_url
         return None, None, None
 
+    def _wait_combat_exit(
+        self,
+        fleet_id,
+        map_speed,
+        battle_ended=False,
+        started=None,
+        engaged=True,
+        min_delay=2,
+        max_delay=10,
+        backoff=1.5,
+        settle=1,
+    ):
+        """
+        Waits until the fleet is out of combat.
+
+        If the combat websocket already signalled the battle end, the map is checked right away.
+        Otherwise the first check is timed from the fleet's last observed combat duration,
+        later checks back off from min_delay by backoff, up to max_delay.
+
+        Args:
+            fleet_id (str): fleet id. ("1"...."15")
+            map_speed (float): Map speed of the fleet.
+            battle_ended (bool): Battle-end signal was received over the combat websocket.
+            started (float): time.monotonic value at the start of combat, used to learn combat durations.
+            engaged (bool): A battle was engaged, only then the combat duration is learned.
+            min_delay (float): Shortest delay between checks, in seconds.
+            max_delay (float): Longest delay between checks, in seconds.
+            backoff (float): Delay growth factor between checks.
+            settle (float): Delay after leaving combat, before the fleet is moved again.
+        """
+        if started is None:
+            started = time.monotonic()
+
+        if battle_ended:
+            delay = 0
+        else:
+            expected = self.cycles.battle_time(fleet_id, default=0) - (
+                time.monotonic() - started
+            )
+            delay = min(max(expected, min_delay), max_delay)
+
+        while True:
+            time.sleep(delay)
+            combat_guid, _, _ = self._fleet_in_combat(
+                fleet_id=fleet_id, map_speed=map_speed
+            )
+            if combat_guid is None:
+                break
+            delay = min(max(delay * backoff, min_delay), max_delay)
+
+        if engaged:
+            self.cycles.observe_battle(fleet_id, time.monotonic() - started)
+        time.sleep(settle)
+
     def _update_position(self, fleet_id, x, y):
         with self.pos_lock:
             self.positions[fleet_id] = (x, y)
@@ -790,7 +2195,9 @@ class FleetManager:
             else:
                 payload["ships"][flp] = self.ship_ids[fleet_id]["ships"][flp]
 
-        return self._make_request(endpoint, payload=payload, put=True, action=3)
+        resp = self._make_request(endpoint, payload=payload, put=True, action=3)
+        self._invalidate_fleets()
+        return resp
 
     def _fuse(self, instance_id, source_id, amount):
         """
@@ -834,44 +2241,19 @@ class FleetManager:
         map_speed,
         base_repair=False,
     ):
-        level_template = []
-        with open(level, "r") as f:
-            for line in f.readlines():
-                cmd_hex, delay_str = line.split(maxsplit=2)
-                cmd_bytes = bytes.fromhex(cmd_hex)
-                delay = float(delay_str)
-                level_template.append((cmd_bytes, delay))
+        level_template = battle.load_template(level)
 
         combat_guid, engage_id, server_url = self._fleet_in_combat(
             fleet_id=fleet_id, map_speed=map_speed
         )
 
-        websocket = self.start_engagement(
+        self._run_templated_battle(
             combat_guid=combat_guid,
             engage_id=engage_id,
-            user_id=self.userid,
             server_url=server_url,
-            return_ws=True,
-        )
-
-        battle_end_event = threading.Event()
-        hb_thread = threading.Thread(
-            target=self._handle_heartbeat,
-            args=(websocket, battle_end_event),
-            daemon=True,
+            template=level_template,
+            fleet_id=fleet_id,
         )
-        hb_thread.start()
-
-        for cmd, delay in level_template:
-            websocket.send_binary(cmd)
-            time.sleep(delay)
-
-        while not battle_end_event.is_set() and websocket.connected:
-            time.sleep(1)
-
-        hb_thread.join(timeout=2)
-        if websocket.connected:
-            websocket.close()
 
         if base_repair:
             self.move(
@@ -883,12 +2265,10 @@ class FleetManager:
             )
             time.sleep(3)
 
-            with self.repair_lock:
-                self.lazy_repair(
-                    fleet_id=fleet_id,
-                    gs_fleet_id=gs_fleet_id,
-                    ship_count=ship_count,
-                )
+            # The next encounter needs the fleet back.
+            self.repair_and_wait(
+                fleet_id=fleet_id, gs_fleet_id=gs_fleet_id, ship_count=ship_count
+            )
 
             time.sleep(1)
             self.launch(fleet_id=fleet_id)
@@ -904,32 +2284,34 @@ class FleetManager:
                 engage_radius=300,
             )
 
-    def _handle_heartbeat(self, websocket, battle_end_event):
+    def _run_templated_battle(
+        self, combat_guid, engage_id, server_url, template, fleet_id
+    ):
+        """
+        Runs a templated battle on the shared battle runtime, returns once the battle has ended.
+
+        Returns:
+            _ (bool): True if the battle-end signal was received.
+        """
+        handshake = self._ws_handshake(
+            combat_guid=combat_guid, engage_id=engage_id, user_id=self.userid
+        )
         try:
-            while websocket.connected:
-                try:
-                    msg = websocket.recv()
-                    if not msg:
-                        continue
+            ended, stats = self.battles.run_battle(
+                url=self._combat_url(server_url),
+                handshake=handshake,
+                template=template,
+            )
+        except Exception as e:
+            print(f"[Fleet-{fleet_id}] Battle error:", e)
+            return False
 
-                    if msg == b"\x01\x00\x00\x00\x06":
-                        # print("Battle end signal received.")
-                        battle_end_event.set()
-                        break
+        self.replay_stats[fleet_id] = stats
+        print(f"[Fleet-{fleet_id}] replay {stats.summary()}")
+        return ended
 
-                    if (
-                        isinstance(msg, (bytes, bytearray))
-                        and len(msg) == 9
-                        and msg.startswith(b"\x05\x00\x00\x00")
-                    ):
-                        pong = b"\x05\x00\x04" + msg[-4:]
-                        websocket.send_binary(pong)
-                except Exception as e:
-                    print("Heartbeat error:", e)
-                    break
-        finally:
-            pass
-            # print("Heartbeat thread stopped")
+    def _combat_url(self, server_url):
+        return f"{COMBAT_WS_SCHEME}://{server_url}:{COMBAT_WS_PORT}"
 
     def _ws_handshake(self, combat_guid: str, engage_id: int, user_id: int) -> str:
         msg = bytearray(b"CLN")  # writeUTFBytes("CLN") -> raw ASCII
@@ -952,7 +2334,7 @@ class FleetManager:
         return_ws: bool = False,
     ):
         ws = websocket.create_connection(
-            "wss://" + server_url + ":3443",
+            self._combat_url(server_url),
             header=[
                 "Origin: {BASE_URL}",
                 "Cache-Control: no-cache",
@@ -993,7 +2375,9 @@ class FleetManager:
     def repair_fleet(self, fleet_id):
         endpoint = "dock/base/repair"
         payload = {"fleet": int(fleet_id)}
-        return self._make_request(endpoint, payload=payload, put=True, action=4)
+        resp = self._make_request(endpoint, payload=payload, put=True, action=4)
+        self._invalidate_fleets()
+        return resp
 
     def repair_speed_up(self, fleet_id):
         endpoint = "dock/base/repair/default"
@@ -1006,10 +2390,63 @@ class FleetManager:
         }
         return self._make_request(endpoint, payload=payload, post=True, action=5)
 
-    def get_fleets(self):
-        """Returns all docked/active fleets for this user."""
-        endpoint = f"users/{self.userid}/dock/base/fleets"
-        return self._make_request(endpoint)
+    def get_fleets(self, refresh=False):
+        """
+        ***Thread-locked***. Returns all docked/active fleets for this user.
+
+        The response is shared between threads as a snapshot for self.fleets_ttl seconds,
+        calls that mutate fleet state drop it through self._invalidate_fleets.
+
+        Args:
+            refresh (bool): Ignore the current snapshot and fetch a new one.
+
+        Returns:
+            resp (dict): Response data in json format.
+        """
+        with self.fleets_lock:
+            self._fetch_fleets(refresh)
+            return self._fleets_snapshot
+
+    def _fetch_fleets(self, refresh=False):
+        """
+        Fetches a new fleet snapshot if refresh is set or the current one is stale. self.fleets_lock must be held.
+        """
+        if refresh or self._fleets_stale():
+            endpoint = f"users/{self.userid}/dock/base/fleets"
+            self._store_fleets(self._make_request(endpoint))
+
+    def _fleets_stale(self):
+        return self._fleets_snapshot is None or time.monotonic() >= self._fleets_expiry
+
+    def _store_fleets(self, resp):
+        self._fleets_snapshot = resp
+        self._fleets_index = parse_fleets(resp)
+        self._fleets_expiry = time.monotonic() + self.fleets_ttl
+
+    def _get_fleet(self, fleet_id, refresh=False):
+        """
+        ***Thread-locked***. Looks up a single fleet inside the current fleet snapshot.
+        The snapshot is fetched and read under one lock, so a concurrent invalidation cannot empty it in between.
+
+        Args:
+            fleet_id (str): fleet id. ("1"...."15")
+            refresh (bool): Ignore the current snapshot and fetch a new one.
+
+        Returns:
+            fleet (FleetRecord): Parsed fleet, None if the fleet does not exist.
+        """
+        with self.fleets_lock:
+            self._fetch_fleets(refresh)
+            return self._fleets_index.get(fleet_id)
+
+    def _invalidate_fleets(self):
+        """
+        ***Thread-locked***. Drops the fleet snapshot, next self.get_fleets call fetches fresh data.
+        """
+        with self.fleets_lock:
+            self._fleets_snapshot = None
+            self._fleets_index = {}
+            self._fleets_expiry = 0.0
 
     def launch(self, fleet_id):
         """
@@ -1024,11 +2461,12 @@ class FleetManager:
         endpoint = f"dock/base/fleets/{fleet_id}"
         payload = self._pre_launch_payload(fleet_id)
         resp = self._make_request(endpoint, payload=payload, action=0, post=True)
+        self._invalidate_fleets()
         self._fleet_docked(fleet_id)
         # print(f"[Fleet-{fleet_id}] launched")
         return resp
 
-    def move(
+    def _move_params(
         self,
         fleet_id,
         x,
@@ -1066,56 +2504,230 @@ class FleetManager:
             print(log_str)
 
         self._update_position(fleet_id=fleet_id, x=x, y=y)
-        endpoint = "updateMapObjects2.php"
-        params = {
+        return {
             "actions": action_string,
             "id": self.map_ids[fleet_id],
             "worldindex": self.world_index,
         }
-        return self._make_request(
-            endpoint,
+
+    def move(
+        self,
+        fleet_id,
+        x,
+        y,
+        map_speed,
+        return_dock=False,
+        attack=False,
+        clock=False,
+        engage_radius=100,
+        in_combat_check=False,
+    ):
+        params = self._move_params(
+            fleet_id=fleet_id,
+            x=x,
+            y=y,
+            map_speed=map_speed,
+            return_dock=return_dock,
+            attack=attack,
+            clock=clock,
+            engage_radius=engage_radius,
+            in_combat_check=in_combat_check,
+        )
+        resp = self._make_request(
+            "updateMapObjects2.php",
             params=params,
             secure=False,
             action=1,
             base="web",
         )
+        if return_dock:
+            self._invalidate_fleets()
+        return resp
+
+    def _until_success(self, request, attempts=3, delay=0.5, **kwargs):
+        """
+        Sends a request, repeating it with a growing delay while the server answers 'success': False.
+
+        Args:
+            request (callable): Request method to call with kwargs.
+            attempts (int): Maximum number of tries.
+            delay (float): Delay before the first retry, in seconds.
+
+        Returns:
+            resp (dict): Last response.
+        """
+        for attempt in range(1, attempts + 1):
+            resp = request(**kwargs)
+            if not isinstance(resp, dict) or resp.get("success", True) is not False:
+                return resp
+            if attempt < attempts:
+                self.metrics.record_retry(getattr(self._local, "endpoint", "unknown"))
+                time.sleep(delay * attempt)
+        return resp
+
+    def _plan_repairs(self, fleet_id, ship_count, budget=300, fill=0.8):
+        """
+        Groups ships 1...ship_count into consecutive batches whose predicted repair time
+        fits inside one free speed-up. Ships without an observed repair time are repaired alone.
+
+        Args:
+            fleet_id (str): fleet id. ("1"...."15")
+            ship_count (int): Ships in the fleet.
+            budget (float): Seconds covered by one free speed-up.
+            fill (float): Share of budget a batch is planned to use, leaves room for damage variance.
+
+        Returns:
+            List (List): Ship slots per batch, e.g. [["1", "2"], ["3"]].
+        """
+        groups = []
+        current = []
+        total = 0
+        for slot in range(1, ship_count + 1):
+            predicted = self.ship_repair_times.get((fleet_id, str(slot)), budget)
+            if current and total + predicted > budget * fill:
+                groups.append(current)
+                current = []
+                total = 0
+            current.append(str(slot))
+            total += predicted
+        if current:
+            groups.append(current)
+        return groups
+
+    def _learn_repair(self, fleet_id, group, repair_time, budget=300):
+        """
+        Stores per-ship repair times, a batch's repair time is split in proportion to the previous estimates.
+        """
+        prior = [self.ship_repair_times.get((fleet_id, slot), budget) for slot in group]
+        total = sum(prior) or len(prior)
+        for slot, estimate in zip(group, prior):
+            self.ship_repair_times[(fleet_id, slot)] = repair_time * estimate / total
+
+    def _record_repair(self, fleet_id, seconds):
+        """
+        ***Thread-locked***. Adds the repair time of one battle to the streaming stats of fleet_id.
+        """
+        with self.repair_stats_lock:
+            self.repair_stats[fleet_id].add(seconds)
+
+    def repair_summary(self):
+        """
+        ***Thread-locked***.
+
+        Returns:
+            dict: fleet id -> repair time count, mean, min, max and percentiles.
+        """
+        with self.repair_stats_lock:
+            return {
+                str(fleet_id): stats.snapshot()
+                for fleet_id, stats in self.repair_stats.items()
+            }
+
+    def repair_comparisson(self, title="Repair times"):
+        """
+        ***Thread-locked***. Prints Stat_calculation.repair_comparisson of the repairs observed per fleet.
+        """
+        with self.repair_stats_lock:
+            fleet_ids = sorted(self.repair_stats)
+            data = [self.repair_stats[fleet_id] for fleet_id in fleet_ids]
+            Stat_calculation.repair_comparisson(
+                title, [f"Fleet-{fleet_id}" for fleet_id in fleet_ids], *data
+            )
 
     def lazy_repair(self, fleet_id, gs_fleet_id, ship_count):
-        if not self._fleet_docked(fleet_id=fleet_id):
+        """
+        Repairs the fleet in batches planned by self._plan_repairs, each batch covered by one free speed-up.
+
+        Args:
+            fleet_id (str): fleet id. ("1"...."15")
+            gs_fleet_id (str): Fleet id of the repair slot.
+            ship_count (int): Ships in the fleet.
+
+        Returns:
+            int: Seconds waited for repairs beyond the free speed-ups, max(0, complete_time - currenttime - 300) summed over the batches.
+        """
+        if not self._fleet_docked(fleet_id=fleet_id, refresh=True):
             print("Send fleet to dock first")
             time.sleep(25)
 
-        if ship_count > 1 or fleet_id != gs_fleet_id:
-            self._manage_fleet(fleet_id=fleet_id)
-            time.sleep(0.5)
+        relayout = ship_count > 1 or fleet_id != gs_fleet_id
+        if relayout:
+            self._until_success(self._manage_fleet, fleet_id=fleet_id)
 
         fleet_layout = ""
-        for i in range(1, ship_count + 1):
-            fleet_layout += str(i)
-            if ship_count > 1 or fleet_id != gs_fleet_id:
-                self._manage_fleet(
+        total_repair = 0
+        waited = 0
+        for group in self._plan_repairs(fleet_id=fleet_id, ship_count=ship_count):
+            fleet_layout += "".join(group)
+            if relayout:
+                self._until_success(
+                    self._manage_fleet,
                     fleet_id=fleet_id,
                     gs_fleet_id=gs_fleet_id,
                     fleet_layout=fleet_layout,
                 )
-                time.sleep(0.5)
-            resp = self.repair_fleet(fleet_id=gs_fleet_id)
+            resp = self._until_success(self.repair_fleet, fleet_id=gs_fleet_id)
             repair_time = resp["complete_time"] - resp["currenttime"]
+            total_repair += repair_time
+            self._learn_repair(fleet_id=fleet_id, group=group, repair_time=repair_time)
             if repair_time > 300:
                 print(
                     f"[== Repair ==] [Fleet-{fleet_id}] Waiting {repair_time - 300} s"
                 )
                 time.sleep(repair_time - 300)
-            time.sleep(0.5)
-            self.repair_speed_up(fleet_id=gs_fleet_id)
-            time.sleep(0.5)
+                waited += repair_time - 300
+            if repair_time > 0:
+                self._until_success(self.repair_speed_up, fleet_id=gs_fleet_id)
+
+        self._record_repair(fleet_id=fleet_id, seconds=total_repair)
 
         if fleet_id != gs_fleet_id:
-            self._manage_fleet(
-                fleet_id=fleet_id, gs_fleet_id=gs_fleet_id, fleet_layout=""
+            self._until_success(
+                self._manage_fleet,
+                fleet_id=fleet_id,
+                gs_fleet_id=gs_fleet_id,
+                fleet_layout="",
             )
-            time.sleep(0.5)
-            self._manage_fleet(fleet_id=fleet_id, fleet_layout=fleet_layout)
+            self._until_success(
+                self._manage_fleet, fleet_id=fleet_id, fleet_layout=fleet_layout
+            )
+        return waited
+
+    def repair_and_wait(self, fleet_id, gs_fleet_id, ship_count):
+        """
+        Queues self.lazy_repair on the repair slot of gs_fleet_id and parks the calling fleet thread
+        until the completion callback of the repair notifies it.
+
+        Args:
+            fleet_id (str): fleet id. ("1"...."15")
+            gs_fleet_id (str): Fleet id of the repair slot.
+            ship_count (int): Ships in the fleet.
+
+        Returns:
+            int: Seconds waited for repairs beyond the free speed-ups, see self.lazy_repair.
+        """
+        repaired = threading.Event()
+        future = self.repair_scheduler.submit(
+            gs_fleet_id,
+            self.lazy_repair,
+            fleet_id=fleet_id,
+            gs_fleet_id=gs_fleet_id,
+            ship_count=ship_count,
+        )
+        future.add_done_callback(
+            functools.partial(self._repair_done, fleet_id, repaired)
+        )
+        repaired.wait()
+        return future.result()
+
+    def _repair_done(self, fleet_id, repaired, future):
+        # Runs on the repair slot thread, learns the wait before the fleet thread is woken up.
+        try:
+            if not future.cancelled() and future.exception() is None:
+                self.cycles.observe_repair(fleet_id, future.result())
+                print(f"[== Repair ==] [Fleet-{fleet_id}] Repaired")
+        finally:
+            repaired.set()
 
     def hunt_targets(
         self,
@@ -1136,124 +2748,133 @@ class FleetManager:
 
         level_template = []
         if target_template:
-            with open(target_template, "r") as f:
-                for line in f.readlines():
-                    cmd_hex, delay_str = line.split(maxsplit=2)
-                    cmd_bytes = bytes.fromhex(cmd_hex)
-                    delay = float(delay_str)
-                    level_template.append((cmd_bytes, delay))
+            level_template = battle.load_template(target_template)
+        with self.assign_lock:
+            self.hunting[fleet_id] = (("locator", level, types), map_speed, base_repair)
         while time.time() < timeout:
-            targets = self._filter_by_distance(
-                fecthed_targets=self._fetch_locator_targets(level=level, types=types),
-                fleet_id=fleet_id,
-                level=level,
-                max_distance=80000,
-            )
-
-            if not targets:
-                print(f"[Fleet-{fleet_id}] Could not find targets close to base")
-                time.sleep(60)
-                continue
+            with self.profiler.cycle(fleet_id) as cycle:
+                with cycle.phase("fetch"):
+                    targets = self._locator_targets(level=level, types=types)
+                with cycle.phase("select"):
+                    target = self._assigned_target(
+                        targets=targets,
+                        fleet_id=fleet_id,
+                        level=level,
+                        max_distance=80000,
+                    )
+                    if target is None:
+                        target = self._best_target(
+                            targets=targets,
+                            fleet_id=fleet_id,
+                            map_speed=map_speed,
+                            level=level,
+                            max_distance=80000,
+                            base_repair=base_repair,
+                        )
 
-            target = self._pick_target(targets=targets)
+                if target is None:
+                    print(f"[Fleet-{fleet_id}] Could not find targets close to base")
+                    cycle.sleep(60)
+                    continue
 
-            try:
-                self.move(
-                    fleet_id=fleet_id,
-                    x=target[0] * 100,
-                    y=target[1] * 100,
-                    map_speed=map_speed,
-                    attack=target[3],
-                    clock=clock,
-                )
-                time.sleep(self._travel_time(distance=target[2], map_speed=map_speed))
-                time.sleep(5)
-                combat_guid, engage_id, server_url = self._fleet_in_combat(
-                    fleet_id=fleet_id, map_speed=map_speed
-                )
-                if (
-                    combat_guid is not None
-                    and engage_id is not None
-                    and server_url is not None
-                ):
-                    if level_template:
-                        websocket = self.start_engagement(
-                            combat_guid=combat_guid,
-                            engage_id=engage_id,
-                            user_id=self.userid,
-                            server_url=server_url,
-                            return_ws=True,
+                cycle.target = target[3]
+                try:
+                    with cycle.phase("travel"):
+                        self.move(
+                            fleet_id=fleet_id,
+                            x=target[0] * 100,
+                            y=target[1] * 100,
+                            map_speed=map_speed,
+                            attack=target[3],
+                            clock=clock,
                         )
-
-                        battle_end_event = threading.Event()
-                        hb_thread = threading.Thread(
-                            target=self._handle_heartbeat,
-                            args=(websocket, battle_end_event),
-                            daemon=True,
+                        time.sleep(
+                            self._travel_time(distance=target[2], map_speed=map_speed)
                         )
-                        hb_thread.start()
-
-                        for cmd, delay in level_template:
-                            websocket.send_binary(cmd)
-                            time.sleep(delay)
-
-                        while not battle_end_event.is_set() and websocket.connected:
-                            time.sleep(1)
-
-                        hb_thread.join(timeout=2)
-                        if websocket.connected:
-                            websocket.close()
-                        # print(f"[Fleet-{fleet_id}] Battle ended and connection closed.")
-                    else:
-                        self.start_engagement(
-                            combat_guid=combat_guid,
-                            engage_id=engage_id,
-                            user_id=self.userid,
-                            server_url=server_url,
+                    cycle.sleep(5)
+                    with cycle.phase("engage"):
+                        combat_guid, engage_id, server_url = self._fleet_in_combat(
+                            fleet_id=fleet_id, map_speed=map_speed
                         )
-
-                time.sleep(2)
-                while True:
-                    combat_guid, _, _ = self._fleet_in_combat(
-                        fleet_id=fleet_id, map_speed=map_speed
+                    battle_ended = False
+                    combat_start = time.monotonic()
+                    if (
+                        combat_guid is not None
+                        and engage_id is not None
+                        and server_url is not None
+                    ):
+                        cycle.engaged = True
+                        with cycle.phase("combat"):
+                            if level_template:
+                                battle_ended = self._run_templated_battle(
+                                    combat_guid=combat_guid,
+                                    engage_id=engage_id,
+                                    server_url=server_url,
+                                    template=level_template,
+                                    fleet_id=fleet_id,
+                                )
+                            else:
+                                self.start_engagement(
+                                    combat_guid=combat_guid,
+                                    engage_id=engage_id,
+                                    user_id=self.userid,
+                                    server_url=server_url,
+                                )
+
+                    with cycle.phase("exit"):
+                        self._wait_combat_exit(
+                            fleet_id=fleet_id,
+                            map_speed=map_speed,
+                            battle_ended=battle_ended,
+                            started=combat_start,
+                            engaged=cycle.engaged,
+                        )
+                finally:
+                    self._release_target(target_id=target[3])
+                    print(
+                        f"[Fleet-{fleet_id}] {(timeout - time.time()) / 60 :f} min left"
                     )
-                    if combat_guid is None:
-                        time.sleep(2)
-                        break
-                    time.sleep(10)
-            finally:
-                self._release_target(target_id=target[3])
-                print(f"[Fleet-{fleet_id}] {(timeout - time.time()) / 60 :f} min left")
 
-            if base_repair:
-                delay = self._distance(
-                    fleet_id=fleet_id, target_x=self.base_x, target_y=self.base_y
-                )
-                self.move(
-                    fleet_id=fleet_id,
-                    x=self.base_x,
-                    y=self.base_y,
-                    map_speed=map_speed,
-                    return_dock=True,
-                )
-                time.sleep(
-                    self._travel_time(
-                        distance=delay,
-                        map_speed=map_speed,
-                    )
-                )
-                time.sleep(3)
+                if base_repair:
+                    with cycle.phase("return"):
+                        delay = self._distance(
+                            fleet_id=fleet_id,
+                            target_x=self.base_x,
+                            target_y=self.base_y,
+                        )
+                        self.move(
+                            fleet_id=fleet_id,
+                            x=self.base_x,
+                            y=self.base_y,
+                            map_speed=map_speed,
+                            return_dock=True,
+                        )
+                        time.sleep(
+                            self._travel_time(
+                                distance=delay,
+                                map_speed=map_speed,
+                            )
+                        )
+                    cycle.sleep(3)
+
+                    with cycle.phase("repair"):
+                        # The fleet is launched right after the repair notification.
+                        self.repair_and_wait(
+                            fleet_id=fleet_id,
+                            gs_fleet_id=gs_fleet_id,
+                            ship_count=ship_count,
+                        )
 
-                with self.repair_lock:
-                    self.lazy_repair(
-                        fleet_id=fleet_id,
-                        gs_fleet_id=gs_fleet_id,
-                        ship_count=ship_count,
-                    )
+                    cycle.sleep(1)
+                    with cycle.phase("launch"):
+                        self.launch(fleet_id=fleet_id)
+                    cycle.sleep(2)
 
-                time.sleep(1)
-                self.launch(fleet_id=fleet_id)
-                time.sleep(2)
+        with self.assign_lock:
+            del self.hunting[fleet_id]
+            entry = self.assignments.pop(fleet_id, None)
+        if entry is not None:
+            self._release_target(target_id=entry[1][3])
 
         time.sleep(1)
         self.move(
@@ -1278,12 +2899,11 @@ def test_entrace(fleet_id: str, map_speed: float, level: int, types: int, clock:
         clock (int): Entrance relative to the target.
     """
     fm.launch(fleet_id=fleet_id)
-    targets = fm._filter_by_distance(
-        fecthed_targets=fm._fetch_locator_targets(level=level, types=types),
+    target = fm._nearest_target(
+        targets=fm._locator_targets(level=level, types=types),
         fleet_id=fleet_id,
         level=level,
     )
-    target = fm._pick_target(targets=targets)
     fm.move(
         fleet_id=fleet_id,
         x=target[0] * 100,
@@ -1299,7 +2919,7 @@ def test_entrace(fleet_id: str, map_speed: float, level: int, types: int, clock:
 
 def crew_scenario():
     """
-    Sends out fleets [1-5] to hunt uranium targets, each containing a single ship that can destroy the uranium target. Once all fleets are sent out, 20 Threads are inniated to roll for crews.
+    Sends out fleets [1-5] to hunt uranium targets, each containing a single ship that can destroy the uranium target. Once all fleets are sent out, crews are rolled with 20 transactions in flight.
     """
     tout = time.time() + 60 * 30
     for i in range(1, 6):
@@ -1310,12 +2930,7 @@ def crew_scenario():
         time.sleep(15)
 
     cm._set_defaults(25)
-    for i in range(20):
-        threading.Thread(
-            target=cm.fill_crews,
-            args=(tout, i),
-        ).start()
-        time.sleep(1)
+    cm.fill_crews_pipelined(timeout=tout, window=20)
 
 
 def camp_scenario(campaign_levels: list):
@@ -1362,14 +2977,24 @@ def camp_scenario(campaign_levels: list):
 
 
 if __name__ == "__main__":
+    ENGINE = AsyncEngine()
+    PROFILER = HuntProfiler(LOG_FOLDER)
+    EXPORTER = MetricsExporter(ENGINE.metrics, LOG_FOLDER, interval=60)
+    EXPORTER.add_source("hunts", PROFILER.summary)
+    EXPORTER.start()
+    ROLL_LOG = RollLog(os.path.join(LOG_FOLDER, "rolls.bin"))
     try:
         SESSION = requests.Session()
         SESSION.headers.update(_get_headers())
         with SESSION:
-            cm = CrewManager(session=SESSION)
-            fm = FleetManager(session=SESSION)
+            cm = CrewManager(session=SESSION, engine=ENGINE, roll_log=ROLL_LOG)
+            fm = FleetManager(session=SESSION, engine=ENGINE, profiler=PROFILER)
+            EXPORTER.add_source("repairs", fm.repair_summary)
 
             # Scenario can be created by calling the respective manager functions..
 
     except KeyboardInterrupt:
         print("shutdown. keyboard interput")
+    finally:
+        EXPORTER.stop()
+        ROLL_LOG.close()
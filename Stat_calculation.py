@@ -1,5 +1,7 @@
 import math
 
+import numpy as np
+
 
 def evade(Buffs: list, Alliance_bonus: bool = False, Lab_bonus: bool = False):
     """
@@ -76,6 +78,25 @@ def weapon_range(Base_range: int, Buffs: list):
     return Base_range * (1 + sum([buff / 100 for buff in Buffs]))
 
 
+TICKS_PER_SECOND = 5
+TICK_DIGITS = 9
+
+
+def to_ticks(seconds: float):
+    """
+    Rounds a duration up to whole 0.2 s ticks.
+    The tick count is rounded to TICK_DIGITS decimals first, so float noise like 1.4 * 5 = 7.000000000000001
+    does not push a duration sitting on a tick boundary into the next tick.
+
+    Args:
+        seconds (float): Duration.
+
+    Returns:
+        int: Number of 0.2 s ticks.
+    """
+    return math.ceil(round(seconds * TICKS_PER_SECOND, TICK_DIGITS))
+
+
 def cycle_time(
     Base_reload: float,
     Buffs: list,
@@ -93,7 +114,7 @@ def cycle_time(
         Salvo_reload (float): Salvo reload time.
 
     Returns:
-        float: Calculated reload, rounded up to the nearest 0.2 multiple.
+        float: Calculated reload, rounded up to the nearest 0.2 multiple, see to_ticks.
 
     Example:
         A weapon with 5s reload speed, ranked to the max reload bonus of 75% would shoot roughly 4 times faster -> 5*(1 - 0.75) = 1.25s => 1.4s, rounded up to the nearest 0.2 multiple.
@@ -102,10 +123,7 @@ def cycle_time(
         1 + sum([buff / 100 for buff in Buffs])
     ) + ((Salvo - 1) * Salvo_reload)
 
-    print(f"{calculated_reload:.2}")
-    if calculated_reload % 0.2 != 0:
-        return 0.2 + calculated_reload - calculated_reload % 0.2
-    return calculated_reload
+    return to_ticks(calculated_reload) / TICKS_PER_SECOND
 
 
 def defense(Buffs: list):
@@ -163,6 +181,336 @@ def damage_taken(Projectile_damage: float, Defense_buffs: list, Survival: float)
     return 1 - result
 
 
+def pad_buffs(Buffs: list):
+    """
+    Builds a buff matrix out of buff lists of different lengths, padded with 0 buffs.
+    A 0 buff leaves every formula unchanged, so padded rows give the same results as the original lists.
+
+    Args:
+        Buffs (List): Buff lists, one per combination.
+
+    Returns:
+        np.ndarray: (combinations x buffs) matrix.
+    """
+    width = max((len(row) for row in Buffs), default=0)
+    matrix = np.zeros((len(Buffs), width))
+    for i, row in enumerate(Buffs):
+        matrix[i, : len(row)] = row
+    return matrix
+
+
+def _buff_matrix(Buffs):
+    matrix = np.asarray(Buffs, dtype=float)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    return matrix
+
+
+def _flags(flag, count: int):
+    return np.broadcast_to(np.asarray(flag, dtype=bool), (count,))
+
+
+def _buff_sum(matrix):
+    """
+    Column by column sum of buff / 100, in the same order as sum([buff / 100 for buff in Buffs]).
+    """
+    result = np.zeros(len(matrix))
+    for b in matrix.T:
+        result += b / 100
+    return result
+
+
+def _reduction_product(matrix):
+    result = np.ones(len(matrix))
+    for b in matrix.T:
+        result *= 1 - b / 100
+    return result
+
+
+def evade_batch(Buffs, Alliance_bonus=False, Lab_bonus=False):
+    """
+    evade over many buff combinations.
+
+    Args:
+        Buffs (np.ndarray): (combinations x buffs) matrix of evade buffs, see pad_buffs.
+        Alliance_bonus (bool | np.ndarray): Apply alliance 10% evade buff, per combination or to all.
+        Lab_bonus (bool | np.ndarray): Apply Lab 20% evade buff, per combination or to all.
+
+    Returns:
+        np.ndarray: Evade value of every combination.
+    """
+    matrix = _buff_matrix(Buffs)
+    result = _reduction_product(matrix)
+    result *= np.where(_flags(Alliance_bonus, len(matrix)), 1 - 10 / 100, 1.0)
+    result *= np.where(_flags(Lab_bonus, len(matrix)), 1 - 20 / 100, 1.0)
+    return 1 - result
+
+
+def damage_buff_batch(Buffs, Conquest_yard_bonus=False):
+    """
+    damage_buff over many buff combinations.
+
+    Args:
+        Buffs (np.ndarray): (combinations x buffs) matrix of damage buffs, see pad_buffs.
+        Conquest_yard_bonus (bool | np.ndarray): Apply 10% building damage bonus, per combination or to all.
+
+    Returns:
+        np.ndarray: Damage buff of every combination.
+    """
+    matrix = _buff_matrix(Buffs)
+    result = np.ones(len(matrix))
+    for b in matrix.T:
+        result *= 1 + b / 100
+    result *= np.where(_flags(Conquest_yard_bonus, len(matrix)), 1 + 10 / 100, 1.0)
+    return result - 1
+
+
+def projectile_damage_batch(Base_damage, Salvo, Multishot, Damage_buffs):
+    """
+    projectile_damage over many damage buff combinations.
+
+    Args:
+        Base_damage (int | np.ndarray): Base damage of combined weapon damage.
+        Salvo (int | np.ndarray): Salvo count of the weapon.
+        Multishot (int | np.ndarray): Multishot of the weapon.
+        Damage_buffs (np.ndarray): (combinations x buffs) matrix of damage buffs.
+
+    Returns:
+        np.ndarray: Projectile damage of every combination.
+    """
+    return (np.asarray(Base_damage, dtype=float) / Salvo / Multishot) * (
+        damage_buff_batch(Damage_buffs) + 1
+    )
+
+
+def weapon_range_batch(Base_range, Buffs):
+    """
+    weapon_range over many range buff combinations.
+
+    Args:
+        Base_range (int | np.ndarray): Base weapon range.
+        Buffs (np.ndarray): (combinations x buffs) matrix of range buffs.
+
+    Returns:
+        np.ndarray: Range of every combination.
+    """
+    return Base_range * (1 + _buff_sum(_buff_matrix(Buffs)))
+
+
+def cycle_time_batch(Base_reload, Buffs, Rank_bonus=0.75, Salvo=1, Salvo_reload=1):
+    """
+    cycle_time over many reload buff combinations.
+
+    Args:
+        Base_reload (float | np.ndarray): Base weapon reload time.
+        Buffs (np.ndarray): (combinations x buffs) matrix of reload buffs.
+        Rank_bonus (float | np.ndarray): Reload bonus provided by ship rank.
+        Salvo (int | np.ndarray): Salvo count of the weapon.
+        Salvo_reload (float | np.ndarray): Salvo reload time.
+
+    Returns:
+        np.ndarray: Reload of every combination, rounded like cycle_time.
+    """
+    calculated_reload = Base_reload * (1 - np.asarray(Rank_bonus, dtype=float)) / (
+        1 + _buff_sum(_buff_matrix(Buffs))
+    ) + ((np.asarray(Salvo) - 1) * Salvo_reload)
+
+    return to_ticks_batch(calculated_reload) / TICKS_PER_SECOND
+
+
+def to_ticks_batch(seconds):
+    """
+    to_ticks over an array of durations.
+
+    Returns:
+        np.ndarray: Number of 0.2 s ticks, as integers.
+    """
+    return np.ceil(
+        np.round(np.asarray(seconds, dtype=float) * TICKS_PER_SECOND, TICK_DIGITS)
+    ).astype(np.int64)
+
+
+def cycle_ticks_grid(
+    Base_reloads, Buff_totals, Rank_bonuses=(0.75,), Salvos=(1,), Salvo_reload=1
+):
+    """
+    Cycle time of every combination of weapon reload, total reload buff, rank bonus and salvo count, in one call.
+
+    Args:
+        Base_reloads (list): Base weapon reload times.
+        Buff_totals (list): Sums of reload buffs, in %.
+        Rank_bonuses (list): Reload bonuses provided by ship rank.
+        Salvos (list): Salvo counts.
+        Salvo_reload (float): Salvo reload time.
+
+    Returns:
+        np.ndarray: (reloads x buffs x rank bonuses x salvos) cycle times in 0.2 s ticks.
+    """
+    base = np.asarray(Base_reloads, dtype=float)[:, None, None, None]
+    buffs = np.asarray(Buff_totals, dtype=float)[None, :, None, None]
+    rank = np.asarray(Rank_bonuses, dtype=float)[None, None, :, None]
+    salvo = np.asarray(Salvos, dtype=float)[None, None, None, :]
+    calculated_reload = base * (1 - rank) / (1 + buffs / 100) + (
+        (salvo - 1) * Salvo_reload
+    )
+    return to_ticks_batch(calculated_reload)
+
+
+class CycleTimeTable:
+    """
+    Precomputed cycle times of common rank bonus and salvo combinations, over a grid of reloads and reload buffs.
+    Lookups outside the grid are computed on the spot.
+    """
+
+    RANK_BONUSES = (0, 0.25, 0.5, 0.75)
+    SALVOS = (1, 2, 3, 4, 5, 6)
+
+    def __init__(
+        self,
+        Base_reloads,
+        Buff_totals=range(0, 301),
+        Rank_bonuses=RANK_BONUSES,
+        Salvos=SALVOS,
+        Salvo_reload=1,
+    ):
+        """
+        CycleTimeTable constructor
+
+        Args:
+            Base_reloads (list): Base weapon reload times.
+            Buff_totals (list): Sums of reload buffs, in %.
+            Rank_bonuses (list): Reload bonuses provided by ship rank.
+            Salvos (list): Salvo counts.
+            Salvo_reload (float): Salvo reload time.
+        """
+        self.salvo_reload = Salvo_reload
+        self.index = [
+            {value: i for i, value in enumerate(axis)}
+            for axis in (Base_reloads, Buff_totals, Rank_bonuses, Salvos)
+        ]
+        self.ticks = cycle_ticks_grid(
+            list(Base_reloads),
+            list(Buff_totals),
+            list(Rank_bonuses),
+            list(Salvos),
+            Salvo_reload,
+        )
+        self._seconds = (self.ticks / TICKS_PER_SECOND).tolist()
+
+    def lookup(self, Base_reload, Buff_total, Rank_bonus=0.75, Salvo=1):
+        """
+        Args:
+            Base_reload (float): Base weapon reload time.
+            Buff_total (float): Sum of reload buffs, in %.
+            Rank_bonus (float): Reload bonus provided by ship rank.
+            Salvo (int): Salvo count of the weapon.
+
+        Returns:
+            float: Cycle time, rounded up to the nearest 0.2 multiple.
+        """
+        reloads, buffs, ranks, salvos = self.index
+        i = reloads.get(Base_reload)
+        j = buffs.get(Buff_total)
+        k = ranks.get(Rank_bonus)
+        m = salvos.get(Salvo)
+        if i is None or j is None or k is None or m is None:
+            return cycle_time(
+                Base_reload, [Buff_total], Rank_bonus, Salvo, self.salvo_reload
+            )
+        return self._seconds[i][j][k][m]
+
+    def lookup_batch(self, Base_reload, Buff_total, Rank_bonus=0.75, Salvo=1):
+        """
+        self.lookup over arrays of combinations, every value must be on the table grid.
+
+        Returns:
+            np.ndarray: Cycle times.
+        """
+        idx = tuple(
+            np.vectorize(axis.__getitem__, otypes=[np.int64])(np.asarray(values))
+            for axis, values in zip(
+                self.index, (Base_reload, Buff_total, Rank_bonus, Salvo)
+            )
+        )
+        return self.ticks[idx] / TICKS_PER_SECOND
+
+
+def defense_batch(Buffs):
+    """
+    defense over many defense buff combinations.
+
+    Args:
+        Buffs (np.ndarray): (combinations x buffs) matrix of defense buffs.
+
+    Returns:
+        np.ndarray: Defense value of every combination.
+    """
+    return 1 - _reduction_product(_buff_matrix(Buffs))
+
+
+def defense_survival_batch(Buffs):
+    """
+    defense_survival over many survival buff combinations.
+
+    Args:
+        Buffs (np.ndarray): (combinations x buffs) matrix of survival buffs.
+
+    Returns:
+        np.ndarray: Survival defense value of every combination.
+    """
+    matrix = _buff_matrix(Buffs)
+    result = np.ones(len(matrix))
+    for b in matrix.T:
+        result += (b / 200) / 100
+    return 1 - 1 / result
+
+
+def damage_taken_batch(Projectile_damage, Defense_buffs, Survival):
+    """
+    damage_taken over many defense buff combinations.
+
+    Args:
+        Projectile_damage (float | np.ndarray): Projectile damage.
+        Defense_buffs (np.ndarray): (combinations x buffs) matrix of defense buffs.
+        Survival (float | np.ndarray): Survival value of the ship, per combination or for all.
+
+    Returns:
+        np.ndarray: Damage taken of every combination.
+    """
+    result = Projectile_damage * (1 - defense_batch(Defense_buffs))
+    survival = np.asarray(Survival, dtype=float)
+    result = np.where(survival != 0, result / (1 + survival / 20_000), result)
+    return 1 - result
+
+
+def mss_to_seconds(Time: float):
+    """
+    Args:
+        Time (float): Time in (m.s) format. Example 7min 20s -> 7.20
+
+    Returns:
+        int: Time in seconds.
+    """
+    return math.ceil(math.floor(Time) * 60 + Time % 1 * 100)
+
+
+def iter_repair_stats(Damage_times):
+    """
+    Single pass repair_stats over any iterable, for logs that do not fit in a list.
+
+    Args:
+        Damage_times (Iterable): Cummulative damage taken after each battle in (m.s) format.
+
+    Yields:
+        int: Damage taken in seconds for each battle.
+    """
+    prev = 0
+    for t in Damage_times:
+        seconds = mss_to_seconds(t)
+        yield seconds - prev
+        prev = seconds
+
+
 def repair_stats(Damage_times: list):
     """
     Calculates how much damage has been taken for each battle
@@ -175,42 +523,134 @@ def repair_stats(Damage_times: list):
     Example:
         An array [5.10, 10.15, 15.00], would return [310, 305, 285]
     """
-    _ = Damage_times[:]
-    _.insert(0, 0)
-    result = []
-    for i in range(len(_) - 1):
-        sum_seconds_prev = math.ceil(math.floor(_[i]) * 60 + _[i] % 1 * 100)
-        sum_seconds = math.ceil(math.floor(_[i + 1]) * 60 + _[i + 1] % 1 * 100)
-        result.append(sum_seconds - sum_seconds_prev)
+    return list(iter_repair_stats(Damage_times))
 
-    return result
 
+class RepairStats:
+    """
+    Streaming accumulator of repair times: count, mean, min and max are exact,
+    percentiles come from a log-bucket sketch with relative_accuracy relative error.
+    Memory grows with the log of the value range, not with the number of values.
+    """
 
-def repair_comparisson(Title: str, Params: list, *Data: list):
+    def __init__(self, relative_accuracy: float = 0.01):
+        """
+        RepairStats constructor
+
+        Args:
+            relative_accuracy (float): Relative error of the estimated percentiles.
+        """
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.zeros = 0
+        self.buckets = {}
+
+    def add(self, seconds: float):
+        """
+        Adds one repair time.
+
+        Args:
+            seconds (float): Repair time, in seconds.
+        """
+        self.count += 1
+        delta = seconds - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (seconds - self.mean)
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        if seconds <= 0:
+            self.zeros += 1
+        else:
+            key = math.ceil(math.log(seconds) / self._log_gamma)
+            self.buckets[key] = self.buckets.get(key, 0) + 1
+
+    def extend(self, values):
+        for seconds in values:
+            self.add(seconds)
+        return self
+
+    @property
+    def std(self):
+        return math.sqrt(self._m2 / self.count) if self.count else 0.0
+
+    def percentile(self, p: float):
+        """
+        Args:
+            p (float): Percentile, 0...100.
+
+        Returns:
+            float: Estimated repair time at the percentile, in seconds.
+        """
+        if not self.count:
+            return 0.0
+        rank = p / 100 * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return max(self.min, 0.0)
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                estimate = 2 * self.gamma**key / (self.gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "std": self.std,
+            "min": self.min if self.count else 0.0,
+            "max": self.max if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+        }
+
+    def row(self):
+        """
+        Returns:
+            List (str): Average, Min, Max, P50, P90 as "<m>m <s>s" and the number of repairs, a repair_comparisson row.
+        """
+
+        def fmt(seconds):
+            return f"{math.floor(seconds / 60)}m {math.floor(seconds % 60)}s"
+
+        return [
+            fmt(self.mean),
+            fmt(self.min),
+            fmt(self.max),
+            fmt(self.percentile(50)),
+            fmt(self.percentile(90)),
+            self.count,
+        ]
+
+
+def repair_comparisson(Title: str, Params: list, *Data):
     """
-    Prints a table to compare average, min, max repair times for different parameters.
+    Prints a table to compare average, min, max and percentile repair times for different parameters.
 
     Args:
-        Data (List): Lists of repair data to use for the table comparisson
+        Data (List | RepairStats): Lists of repair data in (m.s) format, or already accumulated RepairStats.
         Params (List): List of parameters to be used in the table comparison. (row headers)
     """
     print()
-    print("=" * 60)
+    print("=" * 84)
     print(f"     {Title}     ")
-    print("=" * 60)
+    print("=" * 84)
     data = []
     for l in Data:
-        if not l:
-            data.append(["–", "–", "–", "–"])
+        if not isinstance(l, RepairStats):
+            l = RepairStats().extend(iter_repair_stats(l))
+        if not l.count:
+            data.append(["–"] * 6)
             continue
+        data.append(l.row())
 
-        _ = repair_stats(l)
-        _avg = f"{math.floor(sum(_)/len(_)/60)}m {math.floor(sum(_)/len(_)%60)}s"
-        _min = f"{math.floor(min(_)/60)}m {min(_)%60}s"
-        _max = f"{math.floor(max(_)/60)}m {max(_)%60}s"
-        data.append([_avg, _min, _max, len(_)])
-
-    headers = ["Average", "Min", "Max", "Targets"]
+    headers = ["Average", "Min", "Max", "P50", "P90", "Targets"]
     parameters = Params[:]
     row_format = "{:>12}" * (len(headers) + 1)
     print(row_format.format("", *headers))
@@ -0,0 +1,495 @@
+"""
+Battle templates and command replay.
+
+A template is a list of binary combat commands, each followed by a delay in seconds before the next command.
+Text templates hold one "<hex command> <delay>" pair per line. Compiled templates (.bpt) hold the same data as:
+
+    b"BPT1" | count (uint32) | count delays (float64) | count x [length (uint16) | command bytes]
+
+Compiled templates are memory-mapped, commands and delays are views into the mapping, nothing is copied on load.
+Convert a text template with: python battle.py targets/level.txt targets/level.bpt
+Convert a browser capture (commands with timestamps) with: python battle.py targets/test.txt targets/test.bpt --timestamps
+"""
+
+import argparse
+import asyncio
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import aiohttp
+
+MAGIC = b"BPT1"
+_HEADER = struct.Struct("<4sI")
+_LENGTH = struct.Struct("<H")
+
+BATTLE_END = b"\x01\x00\x00\x00\x06"
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class BattleTemplate:
+    """
+    Commands and delays of a battle template. Iterates as (command, delay) pairs.
+    """
+
+    __slots__ = ("path", "commands", "delays", "_buffer")
+
+    def __init__(self, commands, delays, path=None, buffer=None):
+        """
+        BattleTemplate constructor
+
+        Args:
+            commands (list): Binary commands, bytes or memoryview.
+            delays (Sequence): Delay after each command, in seconds.
+            path (str): Source file of the template.
+            buffer (mmap): Mapping that commands and delays point into, kept open with the template.
+        """
+        self.path = path
+        self.commands = commands
+        self.delays = delays
+        self._buffer = buffer
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __iter__(self):
+        return zip(self.commands, self.delays)
+
+
+class ReplayStats:
+    """
+    Lateness of replayed commands against their scheduled deadlines, in seconds.
+    """
+
+    __slots__ = ("lateness",)
+
+    def __init__(self):
+        self.lateness = []
+
+    def add(self, late: float):
+        self.lateness.append(late)
+
+    @property
+    def count(self):
+        return len(self.lateness)
+
+    @property
+    def mean(self):
+        return sum(self.lateness) / len(self.lateness) if self.lateness else 0.0
+
+    @property
+    def max(self):
+        return max(self.lateness, default=0.0)
+
+    def percentile(self, p: float):
+        """
+        Args:
+            p (float): Percentile, 0...100.
+
+        Returns:
+            float: Nearest-rank percentile of the lateness.
+        """
+        if not self.lateness:
+            return 0.0
+        ordered = sorted(self.lateness)
+        rank = max(math.ceil(p / 100 * len(ordered)), 1)
+        return ordered[rank - 1]
+
+    def summary(self):
+        return (
+            f"{self.count} cmds, late avg {self.mean * 1000:.1f} ms, "
+            f"p95 {self.percentile(95) * 1000:.1f} ms, max {self.max * 1000:.1f} ms"
+        )
+
+
+async def wait_until_async(deadline: float, spin: float = 0.002):
+    """
+    Sleeps until a time.perf_counter deadline. Coarse asyncio.sleep up to spin seconds before it,
+    then yields to the event loop until the deadline, so other battles keep running during the spin.
+
+    Args:
+        deadline (float): time.perf_counter value to wait for.
+        spin (float): Length of the final yielding spin, in seconds.
+    """
+    remaining = deadline - time.perf_counter()
+    if remaining > spin:
+        await asyncio.sleep(remaining - spin)
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(0)
+
+
+async def replay_async(send, template, start: float = None, spin: float = 0.002):
+    """
+    Sends template commands at absolute deadlines measured from start,
+    so send latency and sleep overshoot do not add up over the template.
+
+    Args:
+        send (coroutine function): Sends one binary command.
+        template (BattleTemplate): Template to replay.
+        start (float): time.perf_counter value of the first command, now if not set.
+        spin (float): Length of the final spin before each command, in seconds.
+
+    Returns:
+        ReplayStats: Lateness of every command.
+    """
+    stats = ReplayStats()
+    deadline = time.perf_counter() if start is None else start
+    for cmd, delay in template:
+        await wait_until_async(deadline=deadline, spin=spin)
+        stats.add(time.perf_counter() - deadline)
+        await send(cmd)
+        deadline += delay
+    return stats
+
+
+def heartbeat_reply(msg):
+    """
+    Args:
+        msg (bytes): Message received from the combat server.
+
+    Returns:
+        bytes: Pong for a ping message, None for anything else.
+    """
+    if (
+        isinstance(msg, (bytes, bytearray))
+        and len(msg) == 9
+        and msg.startswith(b"\x05\x00\x00\x00")
+    ):
+        return b"\x05\x00\x04" + msg[-4:]
+    return None
+
+
+class BattleRuntime:
+    """
+    Runs templated battles of every fleet on one event loop, in one background thread.
+
+    Hunting threads hand battles over with self.run_battle and block only on its result,
+    heartbeats, command replay and battle-end detection of all battles are coroutines of the shared loop.
+    """
+
+    def __init__(self, headers: dict = None):
+        """
+        BattleRuntime constructor
+
+        Args:
+            headers (dict): Headers of the websocket upgrade request.
+        """
+        self.headers = headers or {}
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        ***Thread-locked***. Starts the event loop thread, if it is not running yet.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(
+                target=self._loop.run_forever, name="battle-runtime", daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, coro):
+        """
+        Schedules a coroutine on the runtime loop.
+
+        Returns:
+            concurrent.futures.Future: Result of the coroutine.
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run_battle(self, url: str, handshake: bytes, template, timeout: float = None):
+        """
+        Blocking entry point for self.battle, safe to call from any thread.
+
+        Returns:
+            Tuple (bool, ReplayStats): See self.battle.
+        """
+        return self.submit(
+            self.battle(
+                url=url, handshake=handshake, template=template, timeout=timeout
+            )
+        ).result()
+
+    async def _open(self, url: str, handshake: bytes):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(headers=self.headers)
+        ws = await self._session.ws_connect(url, autoping=False, max_msg_size=0)
+        # send CLN + playerId + engageId + combatGuid
+        await ws.send_bytes(handshake)
+        await ws.send_bytes(b"\x01\x00\x05")
+        await ws.receive()
+        await ws.receive()
+        await ws.send_bytes(b"\x01\x00\x0f")
+
+        loop = asyncio.get_running_loop()
+        delay = loop.time() + 1
+        while loop.time() < delay:
+            try:
+                await asyncio.wait_for(ws.receive(), timeout=delay - loop.time())
+            except asyncio.TimeoutError:
+                break
+
+        await ws.send_bytes(b"\x01\x00\x14")
+        await ws.receive()
+        return ws
+
+    async def _receive(self, ws, ended: asyncio.Event):
+        """
+        Answers heartbeats until the battle-end signal arrives or the connection closes.
+
+        Returns:
+            bool: True if the battle-end signal was received.
+        """
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.BINARY:
+                    continue
+                if msg.data == BATTLE_END:
+                    return True
+                pong = heartbeat_reply(msg.data)
+                if pong is not None:
+                    await ws.send_bytes(pong)
+            return False
+        except (aiohttp.ClientError, ConnectionError):
+            return False
+        finally:
+            ended.set()
+
+    async def battle(self, url: str, handshake: bytes, template, timeout: float = None):
+        """
+        Opens a combat websocket, replays template and waits for the battle to end.
+
+        Args:
+            url (str): Combat server websocket url.
+            handshake (bytes): CLN handshake message.
+            template (BattleTemplate): Commands to replay.
+            timeout (float): Seconds to wait for the battle end after the replay, no limit if not set.
+
+        Returns:
+            Tuple (bool, ReplayStats): True if the battle-end signal was received, replay lateness.
+        """
+        ws = await self._open(url=url, handshake=handshake)
+        ended = asyncio.Event()
+        receiver = asyncio.create_task(self._receive(ws, ended))
+        try:
+            stats = await replay_async(send=ws.send_bytes, template=template)
+            try:
+                await asyncio.wait_for(ended.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            signalled = (
+                receiver.done() and not receiver.cancelled() and receiver.result()
+            )
+            return signalled, stats
+        finally:
+            receiver.cancel()
+            await ws.close()
+
+    def close(self):
+        """
+        Closes the websocket session and stops the event loop thread.
+        """
+        if self._loop is None:
+            return
+        if self._session is not None:
+            self.submit(self._session.close()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+        self._thread = None
+        self._session = None
+
+
+def _read_pairs(path: str):
+    """
+    Reads "<hex command> <number>" lines, skipping lines that are not commands (headers, blanks).
+
+    Returns:
+        List (bytes, float): Command, number pairs.
+    """
+    pairs = []
+    with open(path, "r") as f:
+        for line in f.readlines():
+            parts = line.split(maxsplit=2)
+            if len(parts) < 2:
+                continue
+            try:
+                pairs.append((bytes.fromhex(parts[0]), float(parts[1])))
+            except ValueError:
+                continue
+    return pairs
+
+
+def parse_text_template(path: str):
+    """
+    Parses a text template of command, delay lines.
+
+    Args:
+        path (str): Template path.
+
+    Returns:
+        BattleTemplate: Parsed template.
+    """
+    pairs = _read_pairs(path)
+    return BattleTemplate(
+        commands=[cmd for cmd, _ in pairs],
+        delays=[delay for _, delay in pairs],
+        path=path,
+    )
+
+
+def timestamps_to_delays(pairs: list):
+    """
+    Turns commands captured in the browser, stamped with "seconds.milliseconds" of the current minute,
+    into commands followed by sleep durations. The last command has no following timestamp and is dropped.
+
+    Args:
+        pairs (list): (command, timestamp) pairs.
+
+    Returns:
+        List (bytes, float): (command, delay) pairs.
+    """
+    prev = 0
+    times = []
+    for _, stamp in pairs:
+        stamp *= 1000
+        new_time = prev - stamp
+        if new_time > 10000:
+            new_time -= 60000
+        times.append(abs(new_time) / 1000)
+        prev = stamp
+
+    return [(pairs[i][0], times[i + 1]) for i in range(len(pairs) - 1)]
+
+
+def write_compiled(path: str, commands: list, delays: list):
+    """
+    Writes a compiled template. The file is written next to path and moved over it,
+    templates already mapped by load_template keep viewing the previous file.
+
+    Args:
+        path (str): Destination path.
+        commands (list): Binary commands.
+        delays (list): Delay after each command, in seconds.
+    """
+    if len(commands) != len(delays):
+        raise ValueError("commands and delays differ in length")
+
+    fd, tmp = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, len(commands)))
+            f.write(struct.pack(f"<{len(delays)}d", *delays))
+            for cmd in commands:
+                f.write(_LENGTH.pack(len(cmd)))
+                f.write(cmd)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def convert(src: str, dst: str, timestamps: bool = False):
+    """
+    Compiles a text template.
+
+    Args:
+        src (str): Text template path.
+        dst (str): Compiled template path.
+        timestamps (bool): src is a browser capture holding timestamps instead of delays.
+    """
+    pairs = _read_pairs(src)
+    if timestamps:
+        pairs = timestamps_to_delays(pairs)
+    write_compiled(dst, [cmd for cmd, _ in pairs], [delay for _, delay in pairs])
+
+
+def load_compiled(path: str):
+    """
+    Memory-maps a compiled template.
+
+    Args:
+        path (str): Compiled template path.
+
+    Returns:
+        BattleTemplate: Template viewing the mapped file.
+    """
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(buffer)
+    magic, count = _HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a compiled battle template")
+
+    offset = _HEADER.size
+    delays = view[offset : offset + count * 8].cast("d")
+    offset += count * 8
+
+    commands = []
+    for _ in range(count):
+        (length,) = _LENGTH.unpack_from(buffer, offset)
+        offset += _LENGTH.size
+        commands.append(view[offset : offset + length])
+        offset += length
+
+    return BattleTemplate(commands=commands, delays=delays, path=path, buffer=buffer)
+
+
+def load_template(path: str):
+    """
+    ***Thread-locked***. Loads a compiled or text template, cached in-process by path and modification time.
+
+    Args:
+        path (str): Template path.
+
+    Returns:
+        BattleTemplate: Loaded template.
+    """
+    mtime = os.stat(path).st_mtime_ns
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        with open(path, "rb") as f:
+            compiled = f.read(len(MAGIC)) == MAGIC
+        template = load_compiled(path) if compiled else parse_text_template(path)
+        _cache[path] = (mtime, template)
+        return template
+
+
+def clear_cache():
+    """
+    ***Thread-locked***. Drops cached templates. Mappings close once no template references them.
+    """
+    with _cache_lock:
+        _cache.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile a battle template.")
+    parser.add_argument("src", help="Text template path.")
+    parser.add_argument("dst", help="Compiled template path.")
+    parser.add_argument(
+        "--timestamps",
+        action="store_true",
+        help="src is a browser capture with timestamps instead of delays.",
+    )
+    args = parser.parse_args()
+    convert(src=args.src, dst=args.dst, timestamps=args.timestamps)
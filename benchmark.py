@@ -0,0 +1,550 @@
+"""
+Microbenchmarks for the hot paths of the script and end-to-end benchmarks against the offline mock server.
+Run with: python benchmark.py [hash] [stats] [rolls] [rolllog] [hunt] [camp], all benchmarks if none is named.
+"""
+
+import contextlib
+import hashlib
+import io
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import timeit
+from fractions import Fraction
+
+import requests
+
+import numpy as np
+
+import BP_fleet_manager as bp
+import Stat_calculation as stats
+from BP_fleet_manager import get_hash, get_num, get_salt, sign_batch
+from metrics import METRICS
+from mock_server import MockServer
+from roll_log import RECORD_DTYPE, ROLL_REROLL, RollLog, RollLogReader, wilson_interval
+
+SEED = "aaaaaaaaaaaaaabbbb33333355555aa"
+
+
+def _report(name: str, seconds: float, count: int):
+    print(
+        f"{name:<40} {count / seconds:>14,.0f} ops/s {seconds / count * 1e6:>10.2f} us/op"
+    )
+
+
+def _original_get_salt(seed):
+    # get_salt before the salt was cached: rebuilt per call with quadratic insert(0, ...).
+    d = []
+    for i in range(len(seed) - 1, -1, -1):
+        c = 90 - ord(seed[i]) + 97
+        if c == 139:
+            c -= 91
+        elif c >= 130:
+            c -= 81
+        d.insert(0, chr(c))
+    return "".join(d)
+
+
+def bench_hash(count: int = 100_000):
+    """
+    Request signing: original salt rebuild vs cached md5 context vs batch signing.
+
+    Args:
+        count (int): Number of signatures per variant.
+    """
+    params = [str(random.randint(0, 99999999)) for _ in range(count)]
+
+    def uncached():
+        for p in params:
+            hn = random.randint(0, 9999999)
+            salt = _original_get_salt(SEED)
+            hashlib.md5((salt + p + str(get_num(n=hn))).encode()).hexdigest()
+
+    def cached():
+        for p in params:
+            hn = random.randint(0, 9999999)
+            get_hash(SEED, p, hn, True)
+
+    def batch():
+        sign_batch(SEED, params)
+
+    print("====== Request signing ======")
+    assert _original_get_salt(SEED) == get_salt(SEED)
+    _report("get_hash (original)", timeit.timeit(uncached, number=1), count)
+    _report("get_hash (cached md5 context)", timeit.timeit(cached, number=1), count)
+    _report("sign_batch", timeit.timeit(batch, number=1), count)
+
+
+def _buff_rows(count: int, max_buffs: int = 6, high: int = 60, seed: int = 0):
+    rng = random.Random(seed)
+    return [
+        [rng.randint(0, high) for _ in range(rng.randint(0, max_buffs))]
+        for _ in range(count)
+    ]
+
+
+def _stat_cases(count: int):
+    """
+    Scalar function, batch function and per-row arguments of every Stat_calculation formula.
+
+    Returns:
+        List (str, callable, callable): name, scalar(i), batch().
+    """
+    rows = _buff_rows(count)
+    matrix = stats.pad_buffs(rows)
+    rng = np.random.default_rng(0)
+    alliance = rng.random(count) < 0.5
+    lab = rng.random(count) < 0.5
+    conquest = rng.random(count) < 0.5
+    base_reload = rng.uniform(1, 30, count)
+    rank = rng.choice([0, 0.25, 0.5, 0.75], count)
+    salvo = rng.integers(1, 6, count)
+    survival = rng.choice([0, 500, 2500, 10000], count).astype(float)
+    base_damage = rng.integers(100, 20000, count)
+    return [
+        (
+            "evade",
+            lambda i: stats.evade(rows[i], bool(alliance[i]), bool(lab[i])),
+            lambda: stats.evade_batch(matrix, alliance, lab),
+        ),
+        (
+            "damage_buff",
+            lambda i: stats.damage_buff(rows[i], bool(conquest[i])),
+            lambda: stats.damage_buff_batch(matrix, conquest),
+        ),
+        (
+            "projectile_damage",
+            lambda i: stats.projectile_damage(
+                int(base_damage[i]), int(salvo[i]), 2, rows[i]
+            ),
+            lambda: stats.projectile_damage_batch(base_damage, salvo, 2, matrix),
+        ),
+        (
+            "weapon_range",
+            lambda i: stats.weapon_range(500, rows[i]),
+            lambda: stats.weapon_range_batch(500, matrix),
+        ),
+        (
+            "cycle_time",
+            lambda i: stats.cycle_time(
+                float(base_reload[i]), rows[i], float(rank[i]), int(salvo[i]), 0.5
+            ),
+            lambda: stats.cycle_time_batch(base_reload, matrix, rank, salvo, 0.5),
+        ),
+        (
+            "defense",
+            lambda i: stats.defense(rows[i]),
+            lambda: stats.defense_batch(matrix),
+        ),
+        (
+            "defense_survival",
+            lambda i: stats.defense_survival(rows[i]),
+            lambda: stats.defense_survival_batch(matrix),
+        ),
+        (
+            "damage_taken",
+            lambda i: stats.damage_taken(5000.0, rows[i], float(survival[i])),
+            lambda: stats.damage_taken_batch(5000.0, matrix, survival),
+        ),
+    ]
+
+
+def check_stats(count: int = 5000):
+    """
+    Equivalence check: every *_batch function of Stat_calculation must return exactly the scalar results.
+
+    Args:
+        count (int): Random buff combinations per formula.
+    """
+    print("====== Stat_calculation batch equivalence ======")
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [
+            (name, np.array([scalar(i) for i in range(count)], float), batch())
+            for name, scalar, batch in _stat_cases(count)
+        ]
+    for name, expected, got in results:
+        mismatches = np.flatnonzero(expected != got)
+        if len(mismatches):
+            i = mismatches[0]
+            raise AssertionError(
+                f"{name}_batch differs in {len(mismatches)} of {count} rows,"
+                f" row {i}: {got[i]!r} != {expected[i]!r}"
+            )
+        print(f"{name + '_batch':<40} {count} rows identical")
+
+
+def bench_stats(count: int = 20_000):
+    """
+    Stat_calculation formulas: scalar function per combination vs one *_batch call.
+
+    Args:
+        count (int): Buff combinations per formula.
+    """
+    print("====== Stat_calculation ======")
+    for name, scalar, batch in _stat_cases(count):
+        with contextlib.redirect_stdout(io.StringIO()):
+            loop = timeit.timeit(lambda: [scalar(i) for i in range(count)], number=1)
+        _report(f"{name} (scalar)", loop, count)
+        _report(f"{name}_batch", timeit.timeit(batch, number=1), count)
+
+
+def _cycle_grid():
+    reloads = [round(1 + i / 10, 1) for i in range(291)]
+    buffs = list(range(0, 301, 5))
+    return reloads, buffs, stats.CycleTimeTable.RANK_BONUSES, (1, 2, 3)
+
+
+def check_cycle_ticks():
+    """
+    Exactness check: cycle_time, cycle_ticks_grid and CycleTimeTable against exact rational arithmetic,
+    over a grid of decimal reloads, reload buffs, rank bonuses and salvos.
+    """
+    print("====== cycle_time tick rounding ======")
+    reloads, buffs, ranks, salvos = _cycle_grid()
+    grid = stats.cycle_ticks_grid(reloads, buffs, ranks, salvos)
+    table = stats.CycleTimeTable(reloads, buffs, ranks, salvos)
+    checked = 0
+    for i, base in enumerate(reloads):
+        for j, buff in enumerate(buffs):
+            for k, rank in enumerate(ranks):
+                for m, salvo in enumerate(salvos):
+                    exact = Fraction(str(base)) * (1 - Fraction(str(rank))) / (
+                        1 + Fraction(buff, 100)
+                    ) + (salvo - 1)
+                    ticks = math.ceil(exact * stats.TICKS_PER_SECOND)
+                    got = (
+                        grid[i, j, k, m],
+                        stats.to_ticks(stats.cycle_time(base, [buff], rank, salvo)),
+                        stats.to_ticks(table.lookup(base, buff, rank, salvo)),
+                    )
+                    if any(g != ticks for g in got):
+                        raise AssertionError(
+                            f"reload {base}, buff {buff}, rank {rank}, salvo {salvo}:"
+                            f" {got} ticks, exact {ticks}"
+                        )
+                    checked += 1
+    print(f"{'cycle_time / grid / table':<40} {checked} combinations exact")
+
+
+def bench_cycle_time():
+    """
+    DPS sweep over weapon options: scalar cycle_time per combination vs one grid call vs table lookups.
+    """
+    print("====== cycle_time sweep ======")
+    reloads, buffs, ranks, salvos = _cycle_grid()
+    count = len(reloads) * len(buffs) * len(ranks) * len(salvos)
+
+    def scalar():
+        for base in reloads:
+            for buff in buffs:
+                for rank in ranks:
+                    for salvo in salvos:
+                        stats.cycle_time(base, [buff], rank, salvo)
+
+    table = stats.CycleTimeTable(reloads, buffs, ranks, salvos)
+
+    def lookups():
+        for base in reloads:
+            for buff in buffs:
+                for rank in ranks:
+                    for salvo in salvos:
+                        table.lookup(base, buff, rank, salvo)
+
+    _report("cycle_time (scalar)", timeit.timeit(scalar, number=1), count)
+    _report(
+        "cycle_ticks_grid",
+        timeit.timeit(
+            lambda: stats.cycle_ticks_grid(reloads, buffs, ranks, salvos), number=1
+        ),
+        count,
+    )
+    _report("CycleTimeTable.lookup", timeit.timeit(lookups, number=1), count)
+
+
+def use_mock(server: MockServer):
+    """
+    Points the script at a running mock server.
+    """
+    bp.BASE_URL = bp.WORLD_MAP_URL = server.url
+    bp.COMBAT_WS_SCHEME = "ws"
+    bp.COMBAT_WS_PORT = server.port
+
+
+def _request_count():
+    return sum(stats["count"] for stats in METRICS.snapshot()["endpoints"].values())
+
+
+def _report_run(name: str, rate: float, unit: str, per: float, per_unit: str):
+    print(f"{name:<40} {rate:>14,.1f} {unit:<10} {per:>8.2f} {per_unit}")
+
+
+def bench_rolls(duration: float = 10, windows=(1, 8, 20), **server_options):
+    """
+    Crew rolling of crew_scenario: blocking fill_crews vs fill_crews_pipelined.
+
+    Args:
+        duration (float): Seconds rolled per variant.
+        windows (tuple): Pipeline windows to measure.
+        **server_options: MockServer options, e.g. latency.
+    """
+    print("====== Crew rolls (mock server) ======")
+    variants = [("fill_crews", None)] + [
+        (f"fill_crews_pipelined (window={w})", w) for w in windows
+    ]
+    for name, window in variants:
+        server = MockServer(**server_options).start()
+        use_mock(server)
+        try:
+            with requests.Session() as session:
+                cm = bp.CrewManager(session=session, engine=bp.AsyncEngine())
+                METRICS.reset()
+                rolls = server.game.rolls
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    if window is None:
+                        cm._set_defaults(1)
+                        cm.fill_crews(timeout=time.time() + duration)
+                    else:
+                        cm._set_defaults(window)
+                        cm.fill_crews_pipelined(
+                            timeout=time.time() + duration, window=window
+                        )
+                elapsed = time.perf_counter() - start
+                rolls = server.game.rolls - rolls
+                _report_run(
+                    name,
+                    rolls / elapsed,
+                    "rolls/s",
+                    _request_count() / max(rolls, 1),
+                    "requests/roll",
+                )
+        finally:
+            server.stop()
+
+
+def bench_hunt(
+    duration: float = 90, fleets: int = 3, map_speed: float = 4000, **server_options
+):
+    """
+    hunt_targets with base repairs, one thread per fleet like crew_scenario.
+
+    Args:
+        duration (float): Seconds the fleets hunt.
+        fleets (int): Number of hunting fleets.
+        map_speed (float): Map speed of the fleets.
+        **server_options: MockServer options, e.g. latency, battle_time.
+    """
+    print("====== Hunt cycles (mock server) ======")
+    server = MockServer(**server_options).start()
+    use_mock(server)
+    try:
+        with requests.Session() as session:
+            fm = bp.FleetManager(session=session)
+            METRICS.reset()
+            timeout = time.time() + duration
+            threads = [
+                threading.Thread(
+                    target=fm.hunt_targets,
+                    args=(str(i), str(i), 13, 343, timeout, 12, map_speed, 5),
+                    kwargs={"base_repair": True},
+                )
+                for i in range(1, fleets + 1)
+            ]
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            elapsed = time.perf_counter() - start
+            fm.battles.close()
+    finally:
+        server.stop()
+
+    summary = fm.profiler.summary()
+    cycles = sum(profile["cycles"] for profile in summary.values())
+    _report_run(
+        f"hunt_targets ({fleets} fleets)",
+        cycles / elapsed * 3600,
+        "cycles/h",
+        _request_count() / max(cycles, 1),
+        "requests/cycle",
+    )
+    for fleet_id, profile in sorted(summary.items()):
+        phases = ", ".join(
+            f"{name} {pct:.0f}%"
+            for name, pct in profile["phase_pct"].items()
+            if pct >= 1
+        )
+        print(
+            f"  Fleet-{fleet_id}: {profile['kills_per_hour']:.0f} kills/h,"
+            f" idle {profile['idle_pct']:.0f}% ({phases})"
+        )
+    fm.repair_comparisson("Repair times (mock server)")
+
+
+def bench_camp(encounters: int = 5, commands: int = 20, **server_options):
+    """
+    Campaign encounters of camp_scenario, replayed from a generated template over the combat websocket.
+
+    Args:
+        encounters (int): Number of encounters.
+        commands (int): Commands of the generated template.
+        **server_options: MockServer options, e.g. latency, battle_time.
+    """
+    print("====== Campaign encounters (mock server) ======")
+    fd, template = tempfile.mkstemp(suffix=".txt")
+    with os.fdopen(fd, "w") as f:
+        for i in range(commands):
+            f.write(f"0100{i % 256:02x} 0.05\n")
+
+    server = MockServer(**server_options).start()
+    use_mock(server)
+    try:
+        with requests.Session() as session:
+            fm = bp.FleetManager(session=session)
+            with contextlib.redirect_stdout(io.StringIO()):
+                fm.launch(fleet_id="1")
+            METRICS.reset()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(encounters):
+                    server.game.start_combat("1")
+                    fm._start_campaign_encounter(
+                        level=template,
+                        fleet_id="1",
+                        gs_fleet_id="1",
+                        ship_count=1,
+                        map_speed=406,
+                    )
+            elapsed = time.perf_counter() - start
+            fm.battles.close()
+    finally:
+        server.stop()
+        os.remove(template)
+
+    _report_run(
+        "_start_campaign_encounter",
+        encounters / elapsed * 3600,
+        "battles/h",
+        _request_count() / encounters,
+        "requests/battle",
+    )
+
+
+def check_roll_log(duration: float = 5, window: int = 8, **server_options):
+    """
+    Consistency check: the roll log of fill_crews_pipelined must hold every roll and all uranium the mock server charged.
+
+    Args:
+        duration (float): Seconds rolled.
+        window (int): Pipeline window.
+        **server_options: MockServer options, e.g. latency.
+    """
+    print("====== Roll log consistency (mock server) ======")
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, "rolls.bin")
+    server = MockServer(**server_options).start()
+    use_mock(server)
+    try:
+        with requests.Session() as session, RollLog(path) as roll_log:
+            cm = bp.CrewManager(
+                session=session, engine=bp.AsyncEngine(), roll_log=roll_log
+            )
+            rolls, uranium = server.game.rolls, server.game.uranium
+            with contextlib.redirect_stdout(io.StringIO()):
+                cm._set_defaults(window)
+                cm.fill_crews_pipelined(timeout=time.time() + duration, window=window)
+            rolls, uranium = server.game.rolls - rolls, uranium - server.game.uranium
+            kept = len(server.game.crews)
+    finally:
+        server.stop()
+
+    reader = RollLogReader(path)
+    cost = reader.whitelist_cost(cm.whitelist)
+    logged = sum(reader.draws().values())
+    logged_kept = sum(reader.kept().values())
+    ok = logged == rolls and cost["uranium"] == uranium and logged_kept == kept
+    print(
+        f"rolls {logged}/{rolls}, uranium {cost['uranium']}/{uranium}, "
+        f"crews {logged_kept}/{kept}: {'OK' if ok else 'MISMATCH'}"
+    )
+    del reader
+    os.remove(path)
+    os.rmdir(folder)
+
+
+def bench_roll_log(count: int = 5_000_000, appends: int = 200_000):
+    """
+    Roll log appends and aggregate queries over count synthetic rolls.
+
+    Args:
+        count (int): Records in the synthetic log.
+        appends (int): Records appended through RollLog.record.
+    """
+    print("====== Roll log ======")
+    crew_ids = np.fromiter(bp.config.crews, dtype=np.uint32)
+    whitelist = bp.config.whitelist_crews
+    fd, path = tempfile.mkstemp(suffix=".bin")
+    os.close(fd)
+    os.remove(path)
+    try:
+        rng = np.random.default_rng(1)
+        rolled = rng.choice(crew_ids, appends).tolist()
+        with RollLog(path) as roll_log:
+            start = time.perf_counter()
+            for i, crew_id in enumerate(rolled):
+                roll_log.record(ROLL_REROLL, crew_id, uranium=800, thread=i % 8)
+            _report("RollLog.record", time.perf_counter() - start, appends)
+
+        records = np.zeros(count, dtype=RECORD_DTYPE)
+        records["ts"] = time.time() - np.arange(count)[::-1]
+        records["crew_id"] = rng.choice(crew_ids, count)
+        records["uranium"] = 800
+        records["flags"] = ROLL_REROLL
+        with open(path, "ab") as f:
+            records.tofile(f)
+        del records
+
+        total = appends + count
+        start = time.perf_counter()
+        reader = RollLogReader(path)
+        rates = reader.drop_rates()
+        cost = reader.whitelist_cost(whitelist)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{'drop_rates + whitelist_cost':<40} {total:>14,} rolls {elapsed * 1e3:>10.1f} ms"
+        )
+        expected = len(whitelist & set(bp.config.crews)) / len(crew_ids)
+        print(
+            f"hit rate {cost['hit_rate']:.4%} "
+            f"({cost['hit_low']:.4%} - {cost['hit_high']:.4%}), "
+            f"uniform {expected:.4%}, {len(rates)} crew types"
+        )
+        low, high = wilson_interval(0, 10)
+        assert low == 0 and 0.27 < high < 0.28
+        del reader
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    BENCHMARKS = {
+        "hash": bench_hash,
+        "stats": lambda: (
+            check_stats(),
+            check_cycle_ticks(),
+            bench_stats(),
+            bench_cycle_time(),
+        ),
+        "rolls": lambda: bench_rolls(latency=0.02),
+        "rolllog": lambda: (check_roll_log(latency=0.02), bench_roll_log()),
+        "hunt": lambda: bench_hunt(latency=0.02, battle_time=10),
+        "camp": lambda: bench_camp(latency=0.02, battle_time=5),
+    }
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -153,3 +153,180 @@ crew_bonuses = {
     12007: "+8 crit, +30 defense",
     13238: "+15 evade, +30 dmg, +15 def",
 }
+
+# Structured crew_bonuses, a list of effects per crew.
+# stat: effect stat, value: magnitude in % (seconds for base_attack_time), None if the effect has no known magnitude.
+# Optional conditions: "when": "hp" scales with the hull damage taken, "weapon": weapon types the effect applies to,
+# "target": "building" for base attack bonuses, "duration": seconds the effect lasts after combat starts.
+crew_effects = {
+    13001: [
+        {"stat": "repair_time", "value": -50},
+        {"stat": "damage", "value": 30, "when": "hp"},
+        {"stat": "defense", "value": 30, "when": "hp"},
+    ],
+    13002: [
+        {"stat": "damage", "value": 25, "target": "building"},
+        {"stat": "defense", "value": 30},
+        {"stat": "base_attack_time", "value": 60},
+    ],
+    13003: [
+        {"stat": "miss_crits", "value": None},
+        {"stat": "edge_splash", "value": None},
+    ],
+    11011: [
+        {"stat": "combat_speed", "value": 30},
+        {"stat": "drone_stats", "value": None},
+    ],
+    13227: [
+        {"stat": "combat_speed", "value": 100},
+        {"stat": "defense", "value": 35},
+        {"stat": "base_attack_time", "value": 60},
+    ],
+    13223: [
+        {"stat": "defense", "value": 60, "when": "hp"},
+    ],
+    13251: [
+        {"stat": "evade", "value": 50},
+        {"stat": "reload", "value": 50},
+    ],
+    13274: [
+        {"stat": "damage", "value": 25, "target": "building"},
+        {"stat": "defense", "value": 30},
+    ],
+    13246: [
+        {"stat": "damage", "value": 25, "target": "building"},
+        {"stat": "defense", "value": 30},
+    ],
+    13081: [
+        {"stat": "combat_speed", "value": 20},
+        {"stat": "damage", "value": 15},
+        {"stat": "defense", "value": 40, "when": "hp"},
+    ],
+    13153: [
+        {"stat": "damage", "value": 25, "target": "building"},
+        {"stat": "defense", "value": 30},
+        {"stat": "base_attack_time", "value": 60},
+    ],
+    13087: [
+        {"stat": "damage", "value": 17, "target": "building"},
+        {"stat": "defense", "value": 20},
+        {"stat": "base_attack_time", "value": 45},
+    ],
+    12010: [
+        {"stat": "accuracy", "value": 100, "weapon": ("cannon", "missile", "torpedo")},
+    ],
+    12508: [
+        {"stat": "crit", "value": 30},
+        {"stat": "evade", "value": 20},
+    ],
+    12501: [
+        {"stat": "crit", "value": 20},
+        {"stat": "evade", "value": 20},
+    ],
+    12502: [
+        {"stat": "evade", "value": 24},
+        {"stat": "turn_speed", "value": 50},
+    ],
+    11009: [
+        {"stat": "evade", "value": 12},
+        {"stat": "turn_speed", "value": 50},
+    ],
+    12003: [
+        {"stat": "crit", "value": 8, "weapon": ("torpedo",)},
+        {"stat": "combat_speed", "value": 10},
+    ],
+    11013: [
+        {"stat": "crit", "value": 4, "weapon": ("torpedo",)},
+        {"stat": "combat_speed", "value": 5},
+    ],
+    12005: [
+        {"stat": "crit", "value": 11, "weapon": ("mortar",)},
+        {"stat": "anti_mortar_range", "value": 30},
+    ],
+    11014: [
+        {"stat": "crit", "value": 8, "weapon": ("mortar",)},
+    ],
+    12006: [
+        {"stat": "crit", "value": 11, "weapon": ("cannon",)},
+        {"stat": "combat_speed", "value": 100, "duration": 18},
+    ],
+    11005: [
+        {"stat": "combat_speed", "value": 100, "duration": 20},
+    ],
+    12014: [
+        {"stat": "blueprint_drop", "value": 100},
+    ],
+    11002: [
+        {"stat": "blueprint_drop", "value": 100},
+    ],
+    12008: [
+        {"stat": "crit", "value": 8, "weapon": ("rocket",)},
+        {"stat": "splash", "value": 14},
+    ],
+    12001: [
+        {"stat": "damage", "value": 19, "target": "building"},
+        {"stat": "base_attack_time", "value": 30},
+    ],
+    11010: [
+        {"stat": "damage", "value": 14, "target": "building"},
+    ],
+    12004: [
+        {"stat": "crit", "value": 14, "weapon": ("missile",)},
+    ],
+    12507: [
+        {"stat": "vxp", "value": 200},
+    ],
+    11004: [
+        {"stat": "vxp", "value": 100},
+    ],
+    12002: [
+        {"stat": "defense", "value": 30, "when": "hp"},
+        {"stat": "damage", "value": 20, "when": "hp"},
+    ],
+    12013: [
+        {"stat": "defense", "value": 15},
+    ],
+    11007: [
+        {"stat": "defense", "value": 10},
+    ],
+    12503: [
+        {"stat": "splash", "value": 30},
+        {"stat": "spread", "value": 14},
+    ],
+    12011: [
+        {"stat": "splash", "value": 30},
+        {"stat": "spread", "value": 14},
+    ],
+    13004: [
+        {"stat": "crit", "value": 8, "weapon": ("uav",)},
+        {"stat": "chain", "value": 35},
+    ],
+    12505: [
+        {"stat": "crit", "value": 8, "weapon": ("uav",)},
+        {"stat": "chain", "value": 14},
+    ],
+    11001: [
+        {"stat": "cargo", "value": 500},
+        {"stat": "salvage", "value": 50},
+    ],
+    11003: [
+        {"stat": "uranium", "value": 100},
+        {"stat": "rad_defense", "value": 30},
+    ],
+    11008: [
+        {"stat": "zynthium", "value": 100},
+    ],
+    12506: [
+        {"stat": "crit", "value": 8},
+        {"stat": "defense", "value": 30},
+    ],
+    12007: [
+        {"stat": "crit", "value": 8},
+        {"stat": "defense", "value": 30},
+    ],
+    13238: [
+        {"stat": "evade", "value": 15},
+        {"stat": "damage", "value": 30},
+        {"stat": "defense", "value": 15},
+    ],
+}
@@ -0,0 +1,454 @@
+"""
+Crew loadout optimizer.
+
+Scores every crew of config.crew_effects for a ShipProfile with the batch formulas of Stat_calculation:
+offense (damage buff, crit, cycle time) times survival (defense, evade), times optional weights on other stats.
+Scores are relative to the same ship without a crew, 1.25 means 25% better.
+
+The buff products of a profile are memoized, only the crew columns are evaluated per call.
+Crews that are dominated on every stat that matters to a profile are pruned before ranking.
+"""
+
+import functools
+import math
+
+import numpy as np
+
+import config
+import Stat_calculation as stats
+
+COMBAT_STATS = ("damage", "defense", "evade", "reload", "crit")
+
+
+def min_cost_assignment(cost):
+    """
+    Assigns every row to a distinct column with the lowest total cost (Hungarian method).
+
+    Args:
+        cost (np.ndarray): rows x columns cost matrix, math.inf marks forbidden pairs.
+
+    Returns:
+        List (int): Assigned column per row, None for rows left unassigned.
+    """
+    cost = np.asarray(cost, dtype=float)
+    rows, cols = cost.shape
+    if rows == 0 or cols == 0:
+        return [None] * rows
+    if rows > cols:
+        by_col = min_cost_assignment(cost.T)
+        result = [None] * rows
+        for col, row in enumerate(by_col):
+            if row is not None:
+                result[row] = col
+        return result
+
+    finite = cost[np.isfinite(cost)]
+    forbidden = (np.abs(finite).sum() + 1) * (rows + 1) if finite.size else 1.0
+    a = np.where(np.isfinite(cost), cost, forbidden).tolist()
+
+    # potentials and matching are 1-based, column 0 is the virtual start
+    u = [0.0] * (rows + 1)
+    v = [0.0] * (cols + 1)
+    match = [0] * (cols + 1)
+    way = [0] * (cols + 1)
+    for row in range(1, rows + 1):
+        match[0] = row
+        j0 = 0
+        minv = [math.inf] * (cols + 1)
+        used = [False] * (cols + 1)
+        while True:
+            used[j0] = True
+            i0 = match[j0]
+            delta = math.inf
+            j1 = 0
+            for j in range(1, cols + 1):
+                if used[j]:
+                    continue
+                cur = a[i0 - 1][j - 1] - u[i0] - v[j]
+                if cur < minv[j]:
+                    minv[j] = cur
+                    way[j] = j0
+                if minv[j] < delta:
+                    delta = minv[j]
+                    j1 = j
+            for j in range(cols + 1):
+                if used[j]:
+                    u[match[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+
+    result = [None] * rows
+    for j in range(1, cols + 1):
+        if match[j] and math.isfinite(cost[match[j] - 1][j - 1]):
+            result[match[j] - 1] = j - 1
+    return result
+
+
+class ShipProfile:
+    """
+    Base stats of the ship a crew is chosen for, and what the ship is used for.
+    """
+
+    __slots__ = (
+        "name",
+        "damage",
+        "defense",
+        "evade",
+        "reload",
+        "crit",
+        "base_reload",
+        "rank_bonus",
+        "salvo",
+        "salvo_reload",
+        "weapon",
+        "target",
+        "hp_share",
+        "battle_time",
+        "crit_multiplier",
+        "alliance_bonus",
+        "lab_bonus",
+        "conquest_yard_bonus",
+        "offense_weight",
+        "defense_weight",
+        "weights",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        damage: tuple = (),
+        defense: tuple = (),
+        evade: tuple = (),
+        reload: tuple = (),
+        crit: float = 0,
+        base_reload: float = 5,
+        rank_bonus: float = 0.75,
+        salvo: int = 1,
+        salvo_reload: float = 1,
+        weapon: str = "cannon",
+        target: str = "ship",
+        hp_share: float = 0.5,
+        battle_time: float = 30,
+        crit_multiplier: float = 2,
+        alliance_bonus: bool = False,
+        lab_bonus: bool = False,
+        conquest_yard_bonus: bool = False,
+        offense_weight: float = 1,
+        defense_weight: float = 1,
+        weights: dict = None,
+    ):
+        """
+        ShipProfile constructor
+
+        Args:
+            name (str): Profile name.
+            damage (tuple): Damage buffs of the ship, in %.
+            defense (tuple): Defense buffs of the ship, in %.
+            evade (tuple): Evade buffs of the ship, in %.
+            reload (tuple): Reload buffs of the ship, in %.
+            crit (float): Crit chance of the ship, in %.
+            base_reload (float): Base weapon reload time.
+            rank_bonus (float): Reload bonus provided by ship rank.
+            salvo (int): Salvo count of the weapon.
+            salvo_reload (float): Salvo reload time.
+            weapon (str): Weapon type, e.g. "cannon", "missile", "torpedo".
+            target (str): "ship" or "building".
+            hp_share (float): Share of a battle hp based effects are active, 0...1.
+            battle_time (float): Typical battle duration, scales effects with a duration.
+            crit_multiplier (float): Damage of a critical hit relative to a normal hit.
+            alliance_bonus (bool): Apply alliance 10% evade buff.
+            lab_bonus (bool): Apply Lab 20% evade buff.
+            conquest_yard_bonus (bool): Apply 10% building damage bonus from conquest yard.
+            offense_weight (float): Exponent of the offense factor.
+            defense_weight (float): Exponent of the survival factor.
+            weights (dict): stat -> exponent of (1 + value / 100) for stats outside COMBAT_STATS, e.g. {"uranium": 1}.
+        """
+        self.name = name
+        self.damage = tuple(damage)
+        self.defense = tuple(defense)
+        self.evade = tuple(evade)
+        self.reload = tuple(reload)
+        self.crit = crit
+        self.base_reload = base_reload
+        self.rank_bonus = rank_bonus
+        self.salvo = salvo
+        self.salvo_reload = salvo_reload
+        self.weapon = weapon
+        self.target = target
+        self.hp_share = hp_share
+        self.battle_time = battle_time
+        self.crit_multiplier = crit_multiplier
+        self.alliance_bonus = alliance_bonus
+        self.lab_bonus = lab_bonus
+        self.conquest_yard_bonus = conquest_yard_bonus
+        self.offense_weight = offense_weight
+        self.defense_weight = defense_weight
+        self.weights = dict(weights or {})
+
+    def stats(self):
+        """
+        Returns:
+            Tuple (str): Stats that change the score of this profile.
+        """
+        return COMBAT_STATS + tuple(sorted(self.weights))
+
+
+@functools.lru_cache(maxsize=None)
+def _reduction(buffs: tuple, alliance_bonus=False, lab_bonus=False):
+    """
+    Memoized product of (1 - buff / 100), the part of the damage taken through defense / evade
+    that does not depend on the crew.
+    """
+    result = 1.0
+    for b in buffs + (10,) * alliance_bonus + (20,) * lab_bonus:
+        result *= 1 - b / 100
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def _amplification(buffs: tuple, conquest_yard_bonus=False):
+    """
+    Memoized product of (1 + buff / 100), the part of the damage buff that does not depend on the crew.
+    """
+    result = 1.0
+    for b in buffs + (10,) * conquest_yard_bonus:
+        result *= 1 + b / 100
+    return result
+
+
+def effective_value(effect: dict, profile: ShipProfile):
+    """
+    Args:
+        effect (dict): Effect of config.crew_effects.
+        profile (ShipProfile): Ship the crew is assigned to.
+
+    Returns:
+        float: Magnitude of the effect for profile, 0 if its conditions do not apply.
+    """
+    value = effect.get("value")
+    if value is None:
+        return 0.0
+    if "target" in effect and effect["target"] != profile.target:
+        return 0.0
+    if "weapon" in effect and profile.weapon not in effect["weapon"]:
+        return 0.0
+    if effect.get("when") == "hp":
+        value *= profile.hp_share
+    if "duration" in effect:
+        value *= min(1.0, effect["duration"] / profile.battle_time)
+    return float(value)
+
+
+class CrewOptimizer:
+    """
+    Ranks crews for ship profiles and picks crews for fleets.
+    """
+
+    def __init__(self, effects: dict = None, names: dict = None):
+        """
+        CrewOptimizer constructor
+
+        Args:
+            effects (dict): crew id -> effects, config.crew_effects by default.
+            names (dict): crew id -> name, config.crews by default.
+        """
+        self.effects = config.crew_effects if effects is None else effects
+        self.names = config.crews if names is None else names
+        self.crew_ids = list(self.effects)
+
+    def values(self, profile: ShipProfile, crew_ids=None):
+        """
+        Args:
+            profile (ShipProfile): Ship the crews are assigned to.
+            crew_ids (list): Crews to evaluate, all crews if not set.
+
+        Returns:
+            np.ndarray: (crews x profile.stats()) matrix of effective crew values.
+        """
+        crew_ids = self.crew_ids if crew_ids is None else crew_ids
+        columns = {stat: i for i, stat in enumerate(profile.stats())}
+        matrix = np.zeros((len(crew_ids), len(columns)))
+        for row, crew_id in enumerate(crew_ids):
+            for effect in self.effects.get(crew_id, ()):
+                col = columns.get(effect["stat"])
+                if col is not None:
+                    matrix[row, col] += effective_value(effect, profile)
+        return matrix
+
+    def prune(self, profile: ShipProfile, crew_ids=None):
+        """
+        Drops crews another crew beats or equals on every stat of the profile, while being better on one.
+        Scores grow with every stat, so a dominated crew never outranks the crew dominating it.
+
+        Returns:
+            List (int): Crew ids that are not dominated, in their original order.
+        """
+        crew_ids = self.crew_ids if crew_ids is None else list(crew_ids)
+        v = self.values(profile, crew_ids)
+        geq = (v[:, None, :] >= v[None, :, :]).all(axis=2)
+        gt = (v[:, None, :] > v[None, :, :]).any(axis=2)
+        dominated = (geq & gt).any(axis=0)
+        return [crew_id for crew_id, d in zip(crew_ids, dominated) if not d]
+
+    def scores(self, profile: ShipProfile, crew_ids=None):
+        """
+        Scores crews through the batch stat formulas, relative to the ship without a crew.
+
+        Returns:
+            np.ndarray: Score per crew.
+        """
+        crew_ids = self.crew_ids if crew_ids is None else crew_ids
+        v = self.values(profile, list(crew_ids) + [None])
+        damage, defense, evade, reload, crit = (v[:, i] for i in range(5))
+
+        amplification = _amplification(
+            profile.damage,
+            profile.conquest_yard_bonus and profile.target == "building",
+        ) * (stats.damage_buff_batch(damage[:, None]) + 1)
+        crit_chance = np.minimum(profile.crit + crit, 100) / 100
+        reload_buffs = np.column_stack(
+            [np.broadcast_to(profile.reload, (len(v), len(profile.reload))), reload]
+        )
+        cycle = stats.cycle_time_batch(
+            profile.base_reload,
+            reload_buffs,
+            profile.rank_bonus,
+            profile.salvo,
+            profile.salvo_reload,
+        )
+        offense = (
+            amplification * (1 + crit_chance * (profile.crit_multiplier - 1)) / cycle
+        )
+
+        taken = (
+            _reduction(profile.defense)
+            * (1 - stats.defense_batch(defense[:, None]))
+            * _reduction(profile.evade, profile.alliance_bonus, profile.lab_bonus)
+            * (1 - stats.evade_batch(evade[:, None]))
+        )
+        survival = 1 / taken
+
+        score = offense**profile.offense_weight * survival**profile.defense_weight
+        for i, stat in enumerate(sorted(profile.weights), start=len(COMBAT_STATS)):
+            score = score * (1 + v[:, i] / 100) ** profile.weights[stat]
+        return score[:-1] / score[-1]
+
+    def rank(self, profile: ShipProfile, crew_ids=None, limit: int = None, prune=True):
+        """
+        Args:
+            profile (ShipProfile): Ship the crews are assigned to.
+            crew_ids (list): Crews to rank, all crews if not set.
+            limit (int): Keep only the limit best crews.
+            prune (bool): Skip dominated crews.
+
+        Returns:
+            List (int, float): (crew id, score) pairs, best first.
+        """
+        if prune:
+            crew_ids = self.prune(profile, crew_ids)
+        elif crew_ids is None:
+            crew_ids = self.crew_ids
+        score = self.scores(profile, crew_ids)
+        order = np.argsort(-score, kind="stable")[:limit]
+        return [(crew_ids[i], float(score[i])) for i in order]
+
+    def assign(self, profiles: dict, available: dict = None):
+        """
+        Picks a crew for every fleet, maximizing the total score.
+
+        Args:
+            profiles (dict): fleet id -> ShipProfile.
+            available (dict): crew id -> number of crews in storage. Without it every crew can be rolled,
+                so every fleet simply gets its best crew.
+
+        Returns:
+            dict: fleet id -> (crew id, score). Fleets left without a crew are left out.
+        """
+        if available is None:
+            return {
+                fleet_id: self.rank(profile, limit=1)[0]
+                for fleet_id, profile in profiles.items()
+            }
+
+        columns = [
+            crew_id
+            for crew_id, count in available.items()
+            if crew_id in self.effects
+            for _ in range(count)
+        ]
+        if not columns:
+            return {}
+        unique = list(dict.fromkeys(columns))
+        fleet_ids = list(profiles)
+        by_crew = {}
+        for fleet_id in fleet_ids:
+            for crew_id, score in zip(unique, self.scores(profiles[fleet_id], unique)):
+                by_crew[fleet_id, crew_id] = score
+        cost = np.array(
+            [
+                [-by_crew[fleet_id, crew_id] for crew_id in columns]
+                for fleet_id in fleet_ids
+            ]
+        )
+        assigned = {}
+        for row, col in enumerate(min_cost_assignment(cost)):
+            if col is not None:
+                assigned[fleet_ids[row]] = (columns[col], float(-cost[row, col]))
+        return assigned
+
+    def suggest_whitelist(self, profiles, top: int = 2, min_gain: float = 1.0):
+        """
+        Crews worth rolling for: the top best crews of every profile.
+
+        Args:
+            profiles (list | dict): ShipProfiles, or fleet id -> ShipProfile.
+            top (int): Crews kept per profile.
+            min_gain (float): Ignore crews scoring at most this, 1.0 drops crews that change nothing.
+
+        Returns:
+            set: Crew ids, usable as CrewManager.whitelist.
+        """
+        if isinstance(profiles, dict):
+            profiles = profiles.values()
+        whitelist = set()
+        for profile in profiles:
+            for crew_id, score in self.rank(profile, limit=top):
+                if score > min_gain:
+                    whitelist.add(crew_id)
+        return whitelist
+
+    def print_ranking(self, profile: ShipProfile, limit: int = 10):
+        """
+        Prints the best crews of profile.
+        """
+        print(f"====== {profile.name} ======")
+        for crew_id, score in self.rank(profile, limit=limit):
+            name = self.names.get(crew_id, str(crew_id))
+            print(f"{name:<40} {(score - 1) * 100:+.1f}%")
+
+
+if __name__ == "__main__":
+    optimizer = CrewOptimizer()
+    profiles = [
+        ShipProfile("Hunter", damage=(30, 20), defense=(40,), evade=(20,)),
+        ShipProfile(
+            "Base attacker",
+            damage=(30,),
+            defense=(40,),
+            target="building",
+            weapon="missile",
+        ),
+        ShipProfile("Uranium hunter", weights={"uranium": 1}),
+    ]
+    for profile in profiles:
+        optimizer.print_ranking(profile)
+    print()
+    print("Whitelist:", sorted(optimizer.suggest_whitelist(profiles)))
@@ -0,0 +1,421 @@
+"""
+Request metrics for the game endpoints and hunt cycle profiling.
+
+Every request made through CrewManager, FleetManager or AsyncEngine is recorded per endpoint group:
+latency histogram, status codes, response bytes and retries. HuntProfiler times the phases of every
+hunt cycle per fleet. MetricsExporter appends periodic snapshots as json lines to the logs folder.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf)
+
+ENDPOINT_GROUPS = (
+    ("roguecrew/", "roguecrew/*"),
+    ("updateMapObjects2.php", "updateMapObjects2.php"),
+    ("bookmarks/", "bookmarks/*"),
+    ("dock/base/", "dock/base/*"),
+)
+
+
+def endpoint_group(endpoint: str):
+    """
+    Args:
+        endpoint (str): Request endpoint or url path.
+
+    Returns:
+        str: Group the endpoint is recorded under, the endpoint itself if it belongs to no group.
+    """
+    for marker, group in ENDPOINT_GROUPS:
+        if marker in endpoint:
+            return group
+    return endpoint.lstrip("/")
+
+
+class EndpointStats:
+    """
+    Counters of one endpoint group.
+    """
+
+    __slots__ = (
+        "count",
+        "errors",
+        "statuses",
+        "bytes",
+        "retries",
+        "latency_sum",
+        "latency_max",
+        "buckets",
+    )
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.statuses = {}
+        self.bytes = 0
+        self.retries = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def percentile(self, p: float):
+        """
+        Args:
+            p (float): Percentile, 0...100.
+
+        Returns:
+            float: Upper bound of the bucket holding the percentile, in seconds.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(math.ceil(p / 100 * self.count), 1)
+        seen = 0
+        for bound, n in zip(LATENCY_BUCKETS, self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.latency_max)
+        return self.latency_max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "statuses": dict(self.statuses),
+            "bytes": self.bytes,
+            "retries": self.retries,
+            "latency": {
+                "mean": self.latency_sum / self.count if self.count else 0.0,
+                "p50": self.percentile(50),
+                "p95": self.percentile(95),
+                "max": self.latency_max,
+                "buckets": {
+                    str(bound): n for bound, n in zip(LATENCY_BUCKETS, self.buckets)
+                },
+            },
+        }
+
+
+class RequestMetrics:
+    """
+    ***Thread-locked***. Request counters per endpoint group.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.endpoints = {}
+
+    def _stats(self, endpoint: str):
+        group = endpoint_group(endpoint)
+        stats = self.endpoints.get(group)
+        if stats is None:
+            stats = self.endpoints[group] = EndpointStats()
+        return stats
+
+    def record(self, endpoint: str, latency: float, status=None, size: int = 0):
+        """
+        Records one finished request.
+
+        Args:
+            endpoint (str): Request endpoint or url path.
+            latency (float): Request duration, in seconds.
+            status (int): HTTP status code, None if no response was received.
+            size (int): Response body size, in bytes.
+        """
+        with self.lock:
+            stats = self._stats(endpoint)
+            stats.count += 1
+            key = str(status) if status is not None else "error"
+            stats.statuses[key] = stats.statuses.get(key, 0) + 1
+            if status is None or status >= 400:
+                stats.errors += 1
+            stats.bytes += size
+            stats.latency_sum += latency
+            stats.latency_max = max(stats.latency_max, latency)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    stats.buckets[i] += 1
+                    break
+
+    def record_retry(self, endpoint: str):
+        with self.lock:
+            self._stats(endpoint).retries += 1
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: Current counters of every endpoint group.
+        """
+        with self.lock:
+            return {
+                "time": datetime.now().isoformat(timespec="seconds"),
+                "uptime": time.time() - self.started,
+                "endpoints": {
+                    group: stats.snapshot() for group, stats in self.endpoints.items()
+                },
+            }
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.endpoints = {}
+
+
+class MetricsExporter:
+    """
+    Appends snapshots of a RequestMetrics every interval seconds to <folder>/metrics-<date>.jsonl.
+    """
+
+    def __init__(self, metrics: RequestMetrics, folder: str, interval: float = 60):
+        """
+        MetricsExporter constructor
+
+        Args:
+            metrics (RequestMetrics): Metrics to export.
+            folder (str): Output folder, created if missing.
+            interval (float): Seconds between snapshots.
+        """
+        self.metrics = metrics
+        self.folder = folder
+        self.interval = interval
+        self.sources = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_source(self, name: str, snapshot):
+        """
+        Adds another snapshot callable, its result is exported under name.
+
+        Args:
+            name (str): Key of the snapshot in the exported record.
+            snapshot (callable): Returns a json serializable snapshot.
+        """
+        self.sources.append((name, snapshot))
+
+    def export(self):
+        """
+        Writes one snapshot right away.
+
+        Returns:
+            str: Path of the written file.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        record = self.metrics.snapshot()
+        for name, snapshot in self.sources:
+            record[name] = snapshot()
+        path = os.path.join(
+            self.folder, f"metrics-{datetime.now().strftime('%Y%m%d')}.jsonl"
+        )
+        with open(path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        return path
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.export()
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="metrics-exporter", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops the exporter thread and writes a final snapshot.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.export()
+
+
+HUNT_PHASES = (
+    "fetch",
+    "select",
+    "travel",
+    "engage",
+    "combat",
+    "exit",
+    "return",
+    "repair",
+    "launch",
+    "idle",
+)
+
+
+class HuntCycle:
+    """
+    Timing record of one hunt cycle of a fleet. Phase durations are in seconds.
+    """
+
+    __slots__ = (
+        "fleet_id",
+        "started",
+        "ended",
+        "phases",
+        "target",
+        "engaged",
+    )
+
+    def __init__(self, fleet_id):
+        self.fleet_id = fleet_id
+        self.started = time.time()
+        self.ended = None
+        self.phases = dict.fromkeys(HUNT_PHASES, 0.0)
+        self.target = None
+        self.engaged = False
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Adds the duration of the with block to phase name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter() - start
+
+    def sleep(self, seconds: float, phase: str = "idle"):
+        """
+        time.sleep that is accounted to phase, fixed delays are idle time by default.
+        """
+        with self.phase(phase):
+            time.sleep(seconds)
+
+    @property
+    def duration(self):
+        return (self.ended or time.time()) - self.started
+
+    def record(self):
+        return {
+            "fleet_id": self.fleet_id,
+            "started": self.started,
+            "duration": self.duration,
+            "target": self.target,
+            "engaged": self.engaged,
+            "phases": dict(self.phases),
+        }
+
+
+class FleetProfile:
+    """
+    Phase totals of the finished hunt cycles of one fleet.
+    """
+
+    __slots__ = ("cycles", "kills", "duration", "phases")
+
+    def __init__(self):
+        self.cycles = 0
+        self.kills = 0
+        self.duration = 0.0
+        self.phases = dict.fromkeys(HUNT_PHASES, 0.0)
+
+    def add(self, cycle: HuntCycle):
+        self.cycles += 1
+        self.kills += cycle.engaged
+        self.duration += cycle.duration
+        for name, seconds in cycle.phases.items():
+            self.phases[name] += seconds
+
+    def snapshot(self):
+        hours = self.duration / 3600
+        return {
+            "cycles": self.cycles,
+            "kills": self.kills,
+            "kills_per_hour": self.kills / hours if hours else 0.0,
+            "mean_cycle": self.duration / self.cycles if self.cycles else 0.0,
+            "idle_pct": (
+                100 * self.phases["idle"] / self.duration if self.duration else 0.0
+            ),
+            "phase_pct": {
+                name: 100 * seconds / self.duration if self.duration else 0.0
+                for name, seconds in self.phases.items()
+            },
+        }
+
+
+class HuntProfiler:
+    """
+    ***Thread-locked***. Collects HuntCycle records per fleet.
+
+    Finished cycles are aggregated per fleet, the last keep cycles are kept in memory
+    and, if a folder is given, every cycle is appended to <folder>/hunts-<date>.jsonl.
+    """
+
+    def __init__(self, folder: str = None, keep: int = 100):
+        """
+        HuntProfiler constructor
+
+        Args:
+            folder (str): Output folder of cycle records, None to keep them in memory only.
+            keep (int): Number of recent cycles kept per fleet.
+        """
+        self.folder = folder
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.fleets = {}
+        self.recent = {}
+
+    @contextmanager
+    def cycle(self, fleet_id):
+        """
+        Times one hunt cycle of fleet_id, the cycle is recorded when the with block exits.
+
+        Yields:
+            HuntCycle: Record to time the phases on.
+        """
+        cycle = HuntCycle(fleet_id)
+        try:
+            yield cycle
+        finally:
+            cycle.ended = time.time()
+            self.finish(cycle)
+
+    def finish(self, cycle: HuntCycle):
+        record = cycle.record()
+        with self.lock:
+            profile = self.fleets.get(cycle.fleet_id)
+            if profile is None:
+                profile = self.fleets[cycle.fleet_id] = FleetProfile()
+                self.recent[cycle.fleet_id] = deque(maxlen=self.keep)
+            profile.add(cycle)
+            self.recent[cycle.fleet_id].append(record)
+            if self.folder is not None:
+                os.makedirs(self.folder, exist_ok=True)
+                path = os.path.join(
+                    self.folder, f"hunts-{datetime.now().strftime('%Y%m%d')}.jsonl"
+                )
+                with open(path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+
+    def records(self, fleet_id):
+        """
+        Returns:
+            list: Recent cycle records of fleet_id, oldest first.
+        """
+        with self.lock:
+            return list(self.recent.get(fleet_id, ()))
+
+    def summary(self):
+        """
+        Returns:
+            dict: Cycles, kills per hour, idle and phase percentages per fleet.
+        """
+        with self.lock:
+            return {
+                str(fleet_id): profile.snapshot()
+                for fleet_id, profile in self.fleets.items()
+            }
+
+
+METRICS = RequestMetrics()
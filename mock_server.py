@@ -0,0 +1,614 @@
+"""
+Offline stand-in for the game servers.
+
+Serves the endpoints used by CrewManager and FleetManager and the combat websocket on one port,
+with configurable latency and failure injection. Game state lives in memory: uranium, crew storage and
+pending crew transactions, fleets and their layouts, damaged ships, locator targets and combat.
+Fleets travel in real time with the same travel time formula as the script, attacks turn into combat on arrival
+and combat lasts battle_time seconds, after which the target is destroyed and replaced.
+
+Run standalone with: python mock_server.py --port 8080 --latency 0.05
+Point the script at it by setting BASE_URL and WORLD_MAP_URL to its url,
+COMBAT_WS_SCHEME to "ws" and COMBAT_WS_PORT to its port, see benchmark.use_mock.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import struct
+import threading
+import time
+import uuid
+
+from aiohttp import web
+
+import battle
+import config
+
+PING = b"\x05\x00\x00\x00"
+_HANDSHAKE = struct.Struct("<3sIIH")
+
+
+class MockFleet:
+    """
+    State of one fleet: dock layout, map position, current move and combat.
+    """
+
+    def __init__(self, fleet_id: str, ship_count: int, x: float, y: float):
+        self.id = fleet_id
+        self.ships = {
+            str(slot): {"id": int(fleet_id) * 100 + slot, "dock": "base"}
+            for slot in range(1, ship_count + 1)
+        }
+        self.layout = dict(self.ships)
+        self.on_map = False
+        self.map_id = None
+        self.x = x
+        self.y = y
+        self.move = None
+        self.attack = None
+        self.dock = False
+        self.combat = None
+
+    def payload(self):
+        return {
+            "id": self.id,
+            "is_on_map": self.on_map,
+            "mapId": self.map_id,
+            "ships": [
+                {"actives": {"fltp": slot, "id": str(ship["id"])}}
+                for slot, ship in self.ships.items()
+            ],
+        }
+
+
+class MockGame:
+    """
+    ***Thread-locked***. In-memory game state shared by all handlers.
+    """
+
+    def __init__(
+        self,
+        uranium: int = 10_000_000,
+        remaining_slots: int = 200,
+        fleet_count: int = 15,
+        ship_count: int = 5,
+        target_count: int = 100,
+        target_radius: float = 20000,
+        battle_time: float = 20,
+        repair_time: float = 40,
+        heartbeat: float = 0.25,
+        host: str = "127.0.0.1",
+        seed: int = None,
+    ):
+        """
+        MockGame constructor
+
+        Args:
+            uranium (int): Starting uranium balance.
+            remaining_slots (int): Free crew storage slots.
+            fleet_count (int): Number of fleets, ids "1"...str(fleet_count).
+            ship_count (int): Ships per fleet.
+            target_count (int): Locator targets alive per level and type.
+            target_radius (float): Targets are spawned within this distance of the base, in map units.
+            battle_time (float): Combat duration, in seconds.
+            repair_time (float): Repair time of one damaged ship, in game seconds.
+            heartbeat (float): Seconds between combat websocket pings.
+            host (str): Combat server host handed out with every combat.
+            seed (int): Random seed of crew rolls and target spawns.
+        """
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+        self.uranium = uranium
+        self.remaining_slots = remaining_slots
+        self.target_count = target_count
+        self.target_radius = target_radius
+        self.battle_time = battle_time
+        self.repair_time = repair_time
+        self.heartbeat = heartbeat
+        self.host = host
+        self.base_x = config.configs_main["base_x"]
+        self.base_y = config.configs_main["base_y"]
+
+        self.crew_types = list(config.crews)
+        self.crews = {}
+        self.transactions = {}
+        self.fleets = {
+            str(i): MockFleet(str(i), ship_count, self.base_x, self.base_y)
+            for i in range(1, fleet_count + 1)
+        }
+        self.targets = {}
+        self.combats = {}
+        self.damaged = set()
+        self.rolls = 0
+        self.kills = 0
+        self._ids = 1000
+
+    def _next_id(self):
+        self._ids += 1
+        return self._ids
+
+    # Crews
+
+    def read_crews(self):
+        with self.lock:
+            return {
+                "remainingSlots": self.remaining_slots,
+                "items": list(self.crews.values()),
+            }
+
+    def balance(self):
+        with self.lock:
+            return {"balances": {"1": {"amount": self.uranium}}}
+
+    def _purchase(self, cost: int):
+        if self.uranium < cost:
+            return {"success": False, "error": "Not enough uranium"}
+        self.uranium -= cost
+        self.rolls += 1
+        transaction_id = self._next_id()
+        crew_id = self.rng.choice(self.crew_types)
+        self.transactions[transaction_id] = crew_id
+        return {
+            "purchase": {
+                "transactionId": transaction_id,
+                "items": [{"crew_id": crew_id}],
+            }
+        }
+
+    def create_crew(self, cost: int = 1000):
+        with self.lock:
+            return self._purchase(cost)
+
+    def reroll_crew(self, transaction_id, cost: int = 800):
+        with self.lock:
+            if self.transactions.pop(int(transaction_id), None) is None:
+                return {"success": False, "error": "Unknown transaction"}
+            return self._purchase(cost)
+
+    def accept_crew(self, transaction_id):
+        with self.lock:
+            crew_id = self.transactions.pop(int(transaction_id), None)
+            if crew_id is None:
+                return {"success": False, "error": "Unknown transaction"}
+            crew = {"id": self._next_id(), "crew_id": str(crew_id), "fleet_id": "0"}
+            self.crews[crew["id"]] = crew
+            self.remaining_slots -= 1
+            return {"item": {"crew_id": crew_id, "id": crew["id"]}}
+
+    def delete_crew(self, long_crew_id):
+        with self.lock:
+            if self.crews.pop(int(long_crew_id), None) is None:
+                return {"success": False, "error": "Unknown crew"}
+            self.remaining_slots += 1
+            return {"success": True}
+
+    def assign_crew(self, long_crew_id, fleet_id):
+        with self.lock:
+            crew = self.crews.get(int(long_crew_id))
+            if crew is None:
+                return {"success": False, "error": "Unknown crew"}
+            crew["fleet_id"] = str(fleet_id)
+            return {"success": True}
+
+    # Targets
+
+    def _spawn(self, level, types):
+        angle = self.rng.uniform(0, 2 * math.pi)
+        dist = self.target_radius * math.sqrt(self.rng.random())
+        target = {
+            "id": str(self._next_id()),
+            "x": round((self.base_x + dist * math.cos(angle)) / 100),
+            "y": round((self.base_y + dist * math.sin(angle)) / 100),
+            "level": level,
+            "type": types,
+            "rank": self.rng.choice("12"),
+        }
+        self.targets[target["id"]] = target
+        return target
+
+    def locator(self, level, types, count):
+        with self.lock:
+            alive = [
+                t
+                for t in self.targets.values()
+                if t["level"] == level and t["type"] == types
+            ]
+            while len(alive) < self.target_count:
+                alive.append(self._spawn(level, types))
+            return {"bookmarks": alive[:count]}
+
+    def vengeance(self):
+        with self.lock:
+            return {"bookmarks": list(self.targets.values())[:50]}
+
+    # Fleets
+
+    def _fleet_by_map_id(self, map_id):
+        for fleet in self.fleets.values():
+            if fleet.map_id is not None and str(fleet.map_id) == str(map_id):
+                return fleet
+        return None
+
+    def _advance(self, fleet: MockFleet, now: float):
+        """
+        Moves fleet forward to now: finishes its move, starts combat on arrival at an attacked target,
+        ends combat after battle_time and docks it on arrival at base.
+        """
+        if fleet.move is not None:
+            x0, y0, x1, y1, depart, arrive = fleet.move
+            if now >= arrive:
+                fleet.x, fleet.y = x1, y1
+                fleet.move = None
+                if fleet.attack is not None:
+                    self._start_combat(fleet, started=arrive, target_id=fleet.attack)
+                    fleet.attack = None
+                elif fleet.dock:
+                    fleet.on_map = False
+                    fleet.map_id = None
+                    fleet.dock = False
+            else:
+                share = (now - depart) / (arrive - depart)
+                fleet.x = x0 + (x1 - x0) * share
+                fleet.y = y0 + (y1 - y0) * share
+
+        if fleet.combat is not None and now >= fleet.combat["ends"]:
+            target_id = fleet.combat["target"]
+            if self.targets.pop(target_id, None) is not None:
+                self.kills += 1
+            self.damaged.update(ship["id"] for ship in fleet.layout.values())
+            self.combats.pop(fleet.combat["guid"], None)
+            fleet.combat = None
+
+    def _start_combat(self, fleet: MockFleet, started: float, target_id=None):
+        combat = {
+            "guid": uuid.uuid4().hex,
+            "engage_id": self._next_id(),
+            "fleet": fleet.id,
+            "target": target_id,
+            "ends": started + self.battle_time,
+        }
+        fleet.combat = combat
+        self.combats[combat["guid"]] = combat
+        return combat
+
+    def start_combat(self, fleet_id: str):
+        """
+        Puts a fleet into combat right away, like a campaign battle engaged by the user.
+        """
+        with self.lock:
+            fleet = self.fleets[fleet_id]
+            self._advance(fleet, time.time())
+            if fleet.combat is None:
+                self._start_combat(fleet, started=time.time())
+
+    def combat(self, guid: str):
+        with self.lock:
+            return self.combats.get(guid)
+
+    def get_fleets(self):
+        now = time.time()
+        with self.lock:
+            for fleet in self.fleets.values():
+                self._advance(fleet, now)
+            return {"fleets": [fleet.payload() for fleet in self.fleets.values()]}
+
+    def launch(self, fleet_id: str):
+        with self.lock:
+            fleet = self.fleets.get(fleet_id)
+            if fleet is None or fleet.on_map:
+                return {"success": False, "error": "Fleet is not in a launchable state"}
+            fleet.on_map = True
+            fleet.map_id = 100000 + int(fleet_id)
+            fleet.x, fleet.y = self.base_x, self.base_y
+            return {"success": True, "mapId": fleet.map_id}
+
+    def set_layout(self, fleet_id: str, ships: dict):
+        with self.lock:
+            fleet = self.fleets.get(fleet_id)
+            if fleet is None or fleet.on_map:
+                return {"success": False, "error": "Fleet is not docked"}
+            for slot, ship in ships.items():
+                if ship.get("id") is None:
+                    fleet.layout.pop(slot, None)
+                else:
+                    fleet.layout[slot] = ship
+            return {"success": True}
+
+    def repair(self, fleet_id: str):
+        now = int(time.time())
+        with self.lock:
+            fleet = self.fleets.get(fleet_id)
+            if fleet is None:
+                return {"success": False, "error": "Unknown fleet"}
+            ships = [
+                ship["id"]
+                for ship in fleet.layout.values()
+                if ship["id"] in self.damaged
+            ]
+            self.damaged.difference_update(ships)
+            repair_time = round(self.repair_time * len(ships))
+            return {
+                "success": True,
+                "complete_time": now + repair_time,
+                "currenttime": now,
+            }
+
+    def update_map(self, map_id, actions: list):
+        """
+        Applies updateMapObjects2.php actions to the fleet with map_id.
+
+        Returns:
+            dict: Map object of the fleet, holding its combat if it is in one.
+        """
+        now = time.time()
+        with self.lock:
+            fleet = self._fleet_by_map_id(map_id)
+            if fleet is None:
+                return {"success": False, "error": "Unknown map object"}
+            self._advance(fleet, now)
+
+            if fleet.combat is None:
+                for action in actions:
+                    if action[0] == "move":
+                        _, x, y, speed, _ = action
+                        dist = math.hypot(x - fleet.x, y - fleet.y)
+                        fleet.move = (
+                            fleet.x,
+                            fleet.y,
+                            x,
+                            y,
+                            now,
+                            now + dist / (speed * 2),
+                        )
+                        fleet.attack = None
+                        fleet.dock = False
+                    elif action[0] == "attack":
+                        fleet.attack = str(action[1])
+                    elif action[0] == "dock":
+                        fleet.dock = True
+                self._advance(fleet, now)
+
+            if fleet.combat is None:
+                return {"objects": [{"data": {}, "actions": []}]}
+            combat = fleet.combat
+            return {
+                "objects": [
+                    {
+                        "data": {"combat_guid": combat["guid"]},
+                        "actions": [
+                            ["combat", combat["engage_id"], combat["guid"], self.host]
+                        ],
+                    }
+                ]
+            }
+
+
+class MockServer:
+    """
+    aiohttp application serving a MockGame, run on its own event loop thread.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        reject_rate: float = 0.0,
+        **game_options,
+    ):
+        """
+        MockServer constructor
+
+        Args:
+            host (str): Interface to listen on.
+            port (int): Port to listen on, 0 picks a free one.
+            latency (float): Mean delay added to every request, in seconds.
+            jitter (float): Standard deviation of the added delay, in seconds.
+            failure_rate (float): Share of requests answered with HTTP 503.
+            reject_rate (float): Share of fleet and repair changes answered with 'success': False.
+            **game_options: MockGame options.
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.reject_rate = reject_rate
+        self.game = MockGame(host=host, **game_options)
+        self.requests = 0
+        self._rng = random.Random(game_options.get("seed"))
+        self._loop = None
+        self._thread = None
+        self._runner = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def app(self):
+        app = web.Application(middlewares=[self._inject])
+        app.router.add_get("/", self._combat)
+        app.router.add_route("*", "/{path:.+}", self._dispatch)
+        return app
+
+    @web.middleware
+    async def _inject(self, request, handler):
+        self.requests += 1
+        delay = (
+            self._rng.gauss(self.latency, self.jitter) if self.jitter else self.latency
+        )
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            return web.json_response({"error": "injected failure"}, status=503)
+        return await handler(request)
+
+    async def _body(self, request):
+        if request.content_type == "application/json":
+            return await request.json()
+        if request.can_read_body:
+            return dict(await request.post())
+        return {}
+
+    async def _dispatch(self, request):
+        path = request.match_info["path"]
+        body = await self._body(request)
+        game = self.game
+
+        if path.startswith("api/bm/roguecrew/"):
+            action = path.rsplit("/", 1)[1]
+            if action == "read":
+                resp = game.read_crews()
+            elif action == "create":
+                resp = game.create_crew()
+            elif action == "reroll":
+                resp = game.reroll_crew(body["transactionId"])
+            elif action == "accept":
+                resp = game.accept_crew(body["transactionId"])
+            elif action == "delete":
+                resp = game.delete_crew(body["id"])
+            elif action == "assign":
+                resp = game.assign_crew(body["id"], body["fleet_id"])
+            else:
+                raise web.HTTPNotFound()
+        elif path == "player/getCurrencyBalance":
+            resp = game.balance()
+        elif path == "api/bm/bookmarks/npctargets":
+            resp = game.locator(
+                level=int(body["levels"]),
+                types=int(body["types"]),
+                count=int(body["count"]),
+            )
+        elif path.startswith("api/bm/bookmarks/vengeance"):
+            resp = game.vengeance()
+        elif path.endswith("/dock/base/fleets") and path.startswith("users/"):
+            resp = game.get_fleets()
+        elif path.startswith("dock/base/"):
+            if self.reject_rate and self._rng.random() < self.reject_rate:
+                return web.json_response(
+                    {"success": False, "error": "injected rejection"}
+                )
+            if path == "dock/base/repair":
+                resp = game.repair(str(body["fleet"]))
+            elif path == "dock/base/repair/default":
+                resp = {"success": True}
+            elif request.method == "PUT":
+                resp = game.set_layout(path.rsplit("/", 1)[1], body.get("ships", {}))
+            else:
+                resp = game.launch(path.rsplit("/", 1)[1])
+        elif path == "updateMapObjects2.php":
+            resp = game.update_map(
+                map_id=request.query["id"],
+                actions=json.loads(request.query["actions"]),
+            )
+        elif path == "base/transitions":
+            resp = {"success": True}
+        else:
+            raise web.HTTPNotFound()
+        return web.json_response(resp)
+
+    async def _combat(self, request):
+        """
+        Combat websocket. Answers the handshake of BattleRuntime._open / FleetManager.start_engagement,
+        pings every heartbeat seconds and sends battle.BATTLE_END once the combat is over.
+        """
+        ws = web.WebSocketResponse(autoping=False, max_msg_size=0)
+        await ws.prepare(request)
+
+        msg = await ws.receive()
+        _, _, _, length = _HANDSHAKE.unpack_from(msg.data)
+        guid = msg.data[_HANDSHAKE.size : _HANDSHAKE.size + length].decode()
+        combat = self.game.combat(guid)
+        if combat is None:
+            await ws.close()
+            return ws
+
+        pinger = None
+        try:
+            async for msg in ws:
+                if msg.type != web.WSMsgType.BINARY:
+                    continue
+                if msg.data == b"\x01\x00\x05":
+                    await ws.send_bytes(b"\x02\x00\x00")
+                    await ws.send_bytes(b"\x03\x00\x00")
+                elif msg.data == b"\x01\x00\x0f" and pinger is None:
+                    pinger = asyncio.create_task(self._ping(ws, combat))
+                elif msg.data == b"\x01\x00\x14":
+                    await ws.send_bytes(b"\x04\x00\x00")
+        finally:
+            if pinger is not None:
+                pinger.cancel()
+        return ws
+
+    async def _ping(self, ws, combat):
+        seq = 0
+        while time.time() < combat["ends"]:
+            seq += 1
+            await ws.send_bytes(PING + b"\x00" + struct.pack("<I", seq))
+            await asyncio.sleep(min(self.game.heartbeat, combat["ends"] - time.time()))
+        await ws.send_bytes(battle.BATTLE_END)
+        await asyncio.sleep(1)
+        await ws.close()
+
+    async def _start(self):
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    def start(self):
+        """
+        Starts serving on a background event loop thread.
+
+        Returns:
+            MockServer: self, once the port is bound.
+        """
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="mock-server", daemon=True
+        )
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the offline mock game server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Seconds.")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--reject-rate", type=float, default=0.0)
+    parser.add_argument("--battle-time", type=float, default=20, help="Seconds.")
+    args = parser.parse_args()
+    server = MockServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        reject_rate=args.reject_rate,
+        battle_time=args.battle_time,
+    ).start()
+    print(f"Mock game server on {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
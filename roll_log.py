@@ -0,0 +1,318 @@
+"""
+Persistent crew roll log.
+
+RollLog appends every crew transaction step (create, reroll, accept, delete) as a fixed size binary record
+to an append-only file. RollLogReader maps the file with numpy and computes drop rates per crew type,
+uranium spent per whitelisted crew and Wilson confidence intervals over the whole history.
+Run with: python roll_log.py [path] to print a summary of a log, logs/rolls.bin by default.
+"""
+
+import math
+import os
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+MAGIC = b"ARLG"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")
+RECORD = struct.Struct("<dIIHH")
+RECORD_DTYPE = np.dtype(
+    [
+        ("ts", "<f8"),
+        ("crew_id", "<u4"),
+        ("uranium", "<u4"),
+        ("thread", "<u2"),
+        ("flags", "<u2"),
+    ]
+)
+
+ROLL_CREATE = 1
+ROLL_REROLL = 2
+ROLL_ACCEPT = 4
+ROLL_DELETE = 8
+ROLL_DRAW = ROLL_CREATE | ROLL_REROLL
+
+
+class RollLog:
+    """
+    ***Thread-locked***. Append-only writer of crew roll records.
+
+    Records arriving after close are dropped, so threads still rolling at shutdown do not fail on the closed file.
+    """
+
+    def __init__(self, path: str):
+        """
+        RollLog constructor
+
+        Args:
+            path (str): Log file, created with its folder if missing. An existing log is appended to.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._file = open(path, "ab")
+        size = self._file.tell()
+        if size == 0:
+            self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        else:
+            _check_header(path)
+            # Drop a record cut off by a crash so the following records stay aligned.
+            aligned = size - (size - HEADER.size) % RECORD.size
+            if aligned != size:
+                self._file.truncate(aligned)
+                self._file.seek(aligned)
+
+    def record(
+        self, flags: int, crew_id: int, uranium: int = 0, thread: int = 0, ts=None
+    ):
+        """
+        Appends one record. Accept and delete records flush the file, so every finished crew is on disk.
+        Does nothing once the log is closed.
+
+        Args:
+            flags (int): ROLL_CREATE, ROLL_REROLL, ROLL_ACCEPT or ROLL_DELETE.
+            crew_id (int): Crew type rolled, accepted or deleted.
+            uranium (int): Uranium spent on the step.
+            thread (int): Thread / pipeline slot number.
+            ts (float): Unix timestamp, now if None.
+        """
+        data = RECORD.pack(
+            time.time() if ts is None else ts, crew_id, uranium, thread, flags
+        )
+        with self.lock:
+            if self._file.closed:
+                return
+            self._file.write(data)
+            if not flags & ROLL_DRAW:
+                self._file.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def close(self):
+        with self.lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _check_header(path: str):
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError(f"{path} is not a roll log")
+    magic, version, record_size = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        raise ValueError(f"{path} is not a roll log of version {VERSION}")
+
+
+def wilson_interval(hits, n, z: float = 1.96):
+    """
+    Wilson score interval of a binomial proportion, works on scalars and numpy arrays.
+
+    Args:
+        hits (int | np.ndarray): Successes.
+        n (int | np.ndarray): Trials.
+        z (float): Normal quantile of the confidence level, 1.96 for 95%.
+
+    Returns:
+        Tuple: Lower and upper bound, 0...1 if n is 0.
+    """
+    n = np.asarray(n, dtype=np.float64)
+    hits = np.asarray(hits, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = hits / n
+        z2n = z * z / n
+        center = (p + z2n / 2) / (1 + z2n)
+        half = z * np.sqrt(p * (1 - p) / n + z2n / (4 * n)) / (1 + z2n)
+    low = np.where(n > 0, np.clip(center - half, 0.0, 1.0), 0.0)
+    high = np.where(n > 0, np.clip(center + half, 0.0, 1.0), 1.0)
+    return low, high
+
+
+class RollLogReader:
+    """
+    Aggregate queries over a roll log. The file is memory mapped, records appended after
+    the reader was created are not seen, create a new reader to refresh.
+    """
+
+    def __init__(self, path: str, since: float = None):
+        """
+        RollLogReader constructor
+
+        Args:
+            path (str): Log file written by RollLog.
+            since (float): Unix timestamp, older records are ignored.
+        """
+        self.path = path
+        _check_header(path)
+        count = (os.path.getsize(path) - HEADER.size) // RECORD.size
+        if count:
+            records = np.memmap(
+                path, dtype=RECORD_DTYPE, mode="r", offset=HEADER.size, shape=(count,)
+            )
+        else:
+            records = np.zeros(0, dtype=RECORD_DTYPE)
+        if since is not None:
+            # Records are appended in time order, up to thread scheduling.
+            records = records[records["ts"] >= since]
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+    def _counts(self, mask):
+        crew_ids = self.records["crew_id"][mask]
+        if not len(crew_ids):
+            return {}
+        counts = np.bincount(crew_ids)
+        (ids,) = np.nonzero(counts)
+        return dict(zip(ids.tolist(), counts[ids].tolist()))
+
+    def draws(self):
+        """
+        Returns:
+            dict: Crew type -> times it was rolled by a create or reroll.
+        """
+        return self._counts((self.records["flags"] & ROLL_DRAW) != 0)
+
+    def kept(self):
+        """
+        Returns:
+            dict: Crew type -> crews accepted and not deleted afterwards.
+        """
+        flags = self.records["flags"]
+        kept = self._counts((flags & ROLL_ACCEPT) != 0)
+        for crew_id, n in self._counts((flags & ROLL_DELETE) != 0).items():
+            kept[crew_id] = kept.get(crew_id, 0) - n
+        return {crew_id: n for crew_id, n in kept.items() if n > 0}
+
+    def drop_rates(self, z: float = 1.96):
+        """
+        Args:
+            z (float): Normal quantile of the confidence level.
+
+        Returns:
+            dict: Crew type -> {"count", "rate", "low", "high"}, rates are per roll.
+        """
+        draws = self.draws()
+        if not draws:
+            return {}
+        ids = list(draws)
+        counts = np.fromiter(draws.values(), dtype=np.int64, count=len(ids))
+        total = counts.sum()
+        low, high = wilson_interval(counts, total, z=z)
+        return {
+            crew_id: {
+                "count": int(count),
+                "rate": float(count / total),
+                "low": float(lo),
+                "high": float(hi),
+            }
+            for crew_id, count, lo, hi in zip(ids, counts, low, high)
+        }
+
+    def whitelist_cost(
+        self,
+        whitelist,
+        create_cost: int = 1000,
+        reroll_cost: int = 800,
+        z: float = 1.96,
+    ):
+        """
+        Uranium per whitelisted crew: observed for the logged rolls and expected for whitelist.
+        The expected cost only depends on the drop rates, so any whitelist can be judged against the log.
+
+        Args:
+            whitelist (set): Crew types rolled for.
+            create_cost (int): Uranium cost of the first roll of a transaction.
+            reroll_cost (int): Uranium cost of every further roll.
+            z (float): Normal quantile of the confidence level.
+
+        Returns:
+            dict: Rolls, hit rate with its interval, expected uranium per crew with its interval,
+                and the observed uranium per kept whitelisted crew.
+        """
+        records = self.records
+        is_draw = (records["flags"] & ROLL_DRAW) != 0
+        rolls = int(is_draw.sum())
+        hits = int(
+            np.isin(
+                records["crew_id"][is_draw], np.fromiter(whitelist, np.uint32)
+            ).sum()
+        )
+        low, high = wilson_interval(hits, rolls, z=z)
+
+        def expected(p):
+            # Rolls until the first hit are geometric with mean 1 / p.
+            if p <= 0:
+                return math.inf
+            return create_cost + (1 / p - 1) * reroll_cost
+
+        kept = sum(n for crew_id, n in self.kept().items() if crew_id in whitelist)
+        uranium = int(records["uranium"].sum(dtype=np.int64))
+        return {
+            "rolls": rolls,
+            "hits": hits,
+            "hit_rate": hits / rolls if rolls else 0.0,
+            "hit_low": float(low),
+            "hit_high": float(high),
+            "expected_uranium": expected(hits / rolls if rolls else 0.0),
+            "expected_low": expected(float(high)),
+            "expected_high": expected(float(low)),
+            "uranium": uranium,
+            "kept": kept,
+            "uranium_per_crew": uranium / kept if kept else math.inf,
+        }
+
+    def print_summary(self, whitelist, names: dict = None, z: float = 1.96):
+        """
+        Prints drop rates per crew type, most rolled first, and the cost of whitelist.
+
+        Args:
+            whitelist (set): Crew types rolled for, marked with *.
+            names (dict): Crew type -> crew name.
+            z (float): Normal quantile of the confidence level.
+        """
+        names = names or {}
+        rates = self.drop_rates(z=z)
+        cost = self.whitelist_cost(whitelist, z=z)
+        print(f"====== Crew rolls ({len(self)} records) ======")
+        print(f"{'':<40}{'Rolls':>10}{'Rate':>10}{'Low':>10}{'High':>10}")
+        for crew_id, rate in sorted(rates.items(), key=lambda item: -item[1]["count"]):
+            marker = "*" if crew_id in whitelist else " "
+            print(
+                f"{marker}{str(names.get(crew_id, crew_id))[:38]:<39}{rate['count']:>10}"
+                f"{rate['rate']:>10.2%}{rate['low']:>10.2%}{rate['high']:>10.2%}"
+            )
+        print(
+            f"Whitelist hit rate : {cost['hit_rate']:.2%} "
+            f"({cost['hit_low']:.2%} - {cost['hit_high']:.2%})"
+        )
+        print(
+            f"Expected uranium per crew : {cost['expected_uranium']:,.0f} "
+            f"({cost['expected_low']:,.0f} - {cost['expected_high']:,.0f})"
+        )
+        print(
+            f"Observed uranium per crew : {cost['uranium_per_crew']:,.0f} "
+            f"({cost['uranium']:,} uranium, {cost['kept']} crews)"
+        )
+
+
+if __name__ == "__main__":
+    import config
+
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join("logs", "rolls.bin")
+    RollLogReader(path).print_summary(config.whitelist_crews, names=config.crews)